@@ -6,6 +6,7 @@ import sys, asyncio, os
 from fastapi import WebSocket
 from playwright.async_api import async_playwright, Browser
 from secrets import token_hex
+from functools import partial
 from service.connectors.abstract import Connector
 from service.connectors.whatsapp import Whatsapp
 from service.connectors.telegram import Telegram
@@ -14,48 +15,43 @@ from service.connectors.twitter import Twitter
 from service.connectors.facebook import Facebook
 
 from playwright.async_api import async_playwright
-from service.config import CHROME_PATH, RESULT_DATA_DIR
-
-if not os.path.exists(RESULT_DATA_DIR):
-    os.mkdir(RESULT_DATA_DIR)
+from service.config import CHROME_PATH, RESULT_DATA_DIR, POST_TASK_TIMEOUT
+from service.scheduler import ConnectorScheduler
+from service.browser_pool import BrowserPool, default_browser_pool
+from service.executors import run_io
 
 LOG = logging.getLogger(__name__)
 
 
 async def test_telegram():
-    async with async_playwright() as p:
-        telegram = Telegram("karboncopy")
-        await telegram.process_data(
-            "data",
-            browser=await p.chromium.launch(
-                headless=False, executable_path=CHROME_PATH
-            ),
-            in_depth=True,
-        )
+    pool = BrowserPool(headless=False)
+    await pool.start()
+    try:
+        telegram = Telegram("karboncopy", None)
+        await telegram.process_data("data", pool=pool, in_depth=True)
+    finally:
+        await pool.stop()
 
 
 async def test_instagram():
-    async with async_playwright() as p:
-        ig = Instagram("newdev00")
+    pool = BrowserPool(headless=False)
+    await pool.start()
+    try:
+        ig = Instagram("newdev00", None)
         #    await ig.process_data("data", in_depth=True)
-        await ig.process_data(
-            "data",
-            browser=await p.chromium.launch(
-                headless=False, executable_path=CHROME_PATH
-            ),
-        )
+        await ig.process_data("data", pool=pool)
+    finally:
+        await pool.stop()
 
 
 async def test_twitter():
     t = Twitter("elonmusk", None)
-    async with async_playwright() as p:
-        await t.process_data(
-            "data",
-            browser=await p.chromium.launch(
-                headless=False, executable_path=CHROME_PATH
-            ),
-            in_depth=True,
-        )
+    pool = BrowserPool(headless=False)
+    await pool.start()
+    try:
+        await t.process_data("data", pool=pool, in_depth=True)
+    finally:
+        await pool.stop()
 
 
 connectors = {
@@ -81,28 +77,43 @@ async def processUserRequest(data, socket: WebSocket):
         device_targets.append("desktop")
     taskId = token_hex(16)
     connectors = []
+    # Created here rather than on import, so importing the package has no
+    # side effects on the working directory
+    await run_io(os.makedirs, RESULT_DATA_DIR, exist_ok=True)
 
-    async with async_playwright() as playwright:
-        chrome = await playwright.chromium.launch(
-            headless=True, executable_path=CHROME_PATH
-        )
-        for key, value in inputs.items():
-            if not value:
-                continue
+    for key, value in inputs.items():
+        if not value:
+            continue
+
+        LOG.info(f"Processing {key} with {value}")
 
-            LOG.info(f"Processing {key} with {value}")
+        connector: Connector = get_connector(key)(value, socket)
+        connectors.append(connector)
 
-            connector: Connector = get_connector(key)(value, socket)
-            connectors.append(connector)
-            await connector.process_data(
+    timings = await ConnectorScheduler().run(
+        {
+            connector.service: partial(
+                connector.process_data,
                 os.path.join(RESULT_DATA_DIR, taskId),
-                browser=chrome,
+                pool=default_browser_pool,
             )
+            for connector in connectors
+        }
+    )
 
     LOG.info("Running post tasks")
-    for connector in connectors:
-        await connector.post_task()
+    post_timings = await ConnectorScheduler(timeout=POST_TASK_TIMEOUT).run(
+        {connector.service: connector.post_task for connector in connectors}
+    )
+    await asyncio.gather(*(connector.wait_for_images() for connector in connectors))
 
+    await socket.send_json(
+        {
+            "type": "system",
+            "status": "TIMINGS",
+            "data": {"process": timings, "post_task": post_timings},
+        }
+    )
     await socket.send_json(
         {"type": "system", "status": "COMPLETED", "resultId": taskId}
     )
@@ -116,8 +127,10 @@ def test_tweets_detection(path):
         data = json.load(f)
 
     print(
-        analyze_tweet_chunks(
-            [{"rest_id": d, "text": data[d]["full_text"]} for d in data]
+        asyncio.run(
+            analyze_tweet_chunks(
+                [{"rest_id": d, "text": data[d]["full_text"]} for d in data]
+            )
         )
     )
 
@@ -133,7 +146,11 @@ def test_tweets_detection(path):
         data = json.load(f)
 
     print(
-        summarise_output([{"rest_id": d, "text": data[d]["full_text"]} for d in data])
+        asyncio.run(
+            summarise_output(
+                [{"rest_id": d, "text": data[d]["full_text"]} for d in data]
+            )
+        )
     )
     # test_tweets_detection(r'D:\DigiLookup\python\data\twitter\elonmusk\tweets.json')
     # exit()
@@ -0,0 +1,27 @@
+"""
+Tweet analysis: LLM spam detection and the local hate speech model.
+
+Heavy dependencies and models are loaded on first use. Call `warm_up` at
+startup to pay that cost before the first request instead.
+"""
+
+import logging
+from time import perf_counter
+
+LOG = logging.getLogger(__name__)
+
+
+def warm_up():
+    """
+    Load NLTK resources, the hate speech model and the Groq client. Triage
+    is disabled if the NLTK data is missing.
+    """
+    started_at = perf_counter()
+
+    from service.analysis.llm_spam_detection import get_llm
+    from service.analysis.triage import triage
+
+    get_llm()
+    triage.load()
+
+    LOG.info(f"Analysis warmed up in {perf_counter() - started_at:.2f}s")
@@ -1,10 +1,41 @@
-import json, re, requests
-from service.config import GROQ_TOKEN, GROQ_MODEL
-from groq import Groq
-
-llm = Groq(
-    api_key=GROQ_TOKEN,
+import asyncio, json, os, re, unicodedata
+from hashlib import sha256
+from random import uniform
+from time import monotonic
+from logging import getLogger
+from service.config import (
+    GROQ_TOKEN,
+    GROQ_MODEL,
+    LLM_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_CONTEXT_TOKENS,
+    LLM_MAX_OUTPUT_TOKENS,
+    CACHE_DIR,
+    CLASSIFICATION_CACHE_SIZE,
 )
+from service.cache import PersistentCache
+from service.analysis.triage import triage
+from service.analysis.report import ReportAggregator, ReasonSummarizer
+
+LOG = getLogger(__name__)
+
+_llm = None
+
+
+def get_llm():
+    """
+    Groq client, created on first use.
+    """
+    global _llm
+    if _llm is None:
+        from groq import AsyncGroq
+
+        # Retries are handled by analyze_chunk, which knows about rate limits
+        _llm = AsyncGroq(
+            api_key=GROQ_TOKEN,
+            max_retries=0,
+        )
+    return _llm
 
 SPAM_DETECT_PROMPT = """Your task is to rate social media tweets. Provide a valid JSON response, without any additional information.
 Example:
@@ -27,91 +58,345 @@ Provide a JSON response such as
 }],
 "summarized_message": "<summarized message here>"}
 
+Tweets are given one JSON object per line.
 Note: Social promotion of one's own account is acceptable. Users can ask others to follow them, as this is common on social media. Motivational tweets are also allowed and should not be considered spam.
 """
 
 
+# Bump whenever SPAM_DETECT_PROMPT changes, so cached results are not reused
+PROMPT_VERSION = "2"
+
+# Rough number of tokens the model writes for a single tweet result
+RESULT_TOKENS = 90
+# Per-tweet overhead of the encoding (keys, quotes, newline)
+TWEET_OVERHEAD_TOKENS = 12
+
+
 class FailedToParseJSON(Exception): ...
 
 
-def analyze_tweet_chunks(tweets):
-    for tweet in tweets:
-        t_urls = re.findall(r'https?://t\.co/\w+', tweet['text'])
-        text = tweet['text']
-        for url in t_urls:
-            try:
-                text = text.replace(url, requests.get(url).url)
-            except Exception:
-                pass
+class TruncatedResponse(Exception): ...
 
-        tweet['text'] = text
 
-    message = llm.chat.completions.create(
-        messages=[
-            {"role": "system", "content": SPAM_DETECT_PROMPT},
-            {"role": "user", "content": json.dumps([json.dumps(t) for t in tweets])},
-        ],
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for english text
+    return len(text) // 4 + 1
+
+
+def encode_tweets(tweets) -> str:
+    """
+    Compact prompt encoding: one JSON object per line, without whitespace.
+    """
+    return "\n".join(
+        json.dumps(
+            {"rest_id": t["rest_id"], "text": t["text"]},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        for t in tweets
+    )
+
+
+class ChunkPlanner:
+    """
+    Packs tweets into chunks that fit the model's context window and whose
+    results fit the output limit. Halves future chunks when a response gets
+    truncated, and grows them back towards the default with each full chunk
+    answered in time.
+    """
+
+    def __init__(
+        self,
+        context_tokens: int = LLM_CONTEXT_TOKENS,
+        output_tokens: int = LLM_MAX_OUTPUT_TOKENS,
+        max_tweets: int = None,
+    ) -> None:
+        self.context_tokens = context_tokens
+        self.output_tokens = output_tokens
+        self.default_max_tweets = max_tweets or max(1, output_tokens // RESULT_TOKENS)
+        self.max_tweets = self.default_max_tweets
+
+    @property
+    def input_budget(self) -> int:
+        return (
+            self.context_tokens
+            - estimate_tokens(SPAM_DETECT_PROMPT)
+            - self.output_tokens
+        )
+
+    def shrink(self, chunk_size: int):
+        self.max_tweets = max(1, min(self.max_tweets, chunk_size // 2))
+        LOG.info(f"Response truncated, chunks now hold at most {self.max_tweets} tweets")
+
+    def grow(self, chunk_size: int):
+        # Only a chunk at the current limit shows that the limit fits
+        if chunk_size < self.max_tweets or self.max_tweets >= self.default_max_tweets:
+            return
+        self.max_tweets = min(
+            self.default_max_tweets, self.max_tweets + max(1, self.max_tweets // 4)
+        )
+
+    def plan(self, tweets):
+        chunk, tokens = [], 0
+        for tweet in tweets:
+            cost = estimate_tokens(tweet["text"]) + TWEET_OVERHEAD_TOKENS
+            if chunk and (
+                tokens + cost > self.input_budget or len(chunk) >= self.max_tweets
+            ):
+                yield chunk
+                chunk, tokens = [], 0
+            chunk.append(tweet)
+            tokens += cost
+        if chunk:
+            yield chunk
+
+
+planner = ChunkPlanner()
+
+classification_cache = PersistentCache(
+    os.path.join(CACHE_DIR, "classifications.sqlite"),
+    max_entries=CLASSIFICATION_CACHE_SIZE,
+)
+
+
+def classification_key(text: str) -> str:
+    """
+    Cache key of a tweet: its normalized text, the model and the prompt version.
+    """
+    text = " ".join(unicodedata.normalize("NFC", text).split())
+    return sha256(f"{GROQ_MODEL}\0{PROMPT_VERSION}\0{text}".encode()).hexdigest()
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a Groq reset duration such as "2m59.56s", "7.66s" or "120ms" to seconds.
+    """
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value or ""):
+        seconds += float(amount) * {"h": 3600, "m": 60, "s": 1, "ms": 0.001}[unit]
+    return seconds
+
+
+class RateLimiter:
+    """
+    Holds requests back while Groq reports an exhausted rate limit, based on
+    the x-ratelimit-* and retry-after headers of its responses.
+    """
+
+    def __init__(self) -> None:
+        self._resume_at = 0.0
+
+    def _pause(self, seconds: float):
+        self._resume_at = max(self._resume_at, monotonic() + seconds)
+
+    def update(self, headers):
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is not None and float(remaining) <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                LOG.info(f"Groq {kind} limit reached, pausing for {reset:.2f}s")
+                self._pause(reset)
+
+    def backoff(self, headers, attempt: int):
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            self._pause(float(retry_after))
+        else:
+            self.update(headers)
+            self._pause(uniform(0, 2**attempt))
+
+    async def wait(self):
+        delay = self._resume_at - monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter()
+
+
+async def complete(messages: list, **kwargs):
+    """
+    Run a chat completion, respecting the rate limits reported by Groq.
+    """
+    await rate_limiter.wait()
+    response = await get_llm().chat.completions.with_raw_response.create(
+        messages=messages,
         model=GROQ_MODEL,
+        **kwargs,
     )
-    try:
-        messages = message.choices[0].message.content
-        if not messages.strip().endswith("}"):
-            messages += "}"
+    rate_limiter.update(response.headers)
+    return response.parse()
 
-        with open("message.json", "w") as f:
-            f.write(messages)
 
-        messages = json.loads(messages)
+async def analyze_tweet_chunks(tweets):
+    message = await complete(
+        [
+            {"role": "system", "content": SPAM_DETECT_PROMPT},
+            {"role": "user", "content": encode_tweets(tweets)},
+        ],
+        max_tokens=planner.output_tokens,
+    )
+    if message.choices[0].finish_reason == "length":
+        raise TruncatedResponse(f"Response truncated for {len(tweets)} tweets")
+    try:
+        messages = json.loads(message.choices[0].message.content)
         return messages
     except json.JSONDecodeError:
         raise FailedToParseJSON("Failed to parse")
 
 
-def analyze_in_bulk(tweets, chunk_size: int = 10):
-    messages = []
-    while tweets:
-        chunks = tweets[:chunk_size]
-        tweets = tweets[chunk_size:]
-        response = None
-        for _ in range(3):
+async def analyze_chunk(chunk, slots: asyncio.Semaphore, max_retries: int = LLM_MAX_RETRIES):
+    """
+    Analyze a single chunk, retrying with jittered backoff on parse and API
+    errors. A truncated response splits the chunk in two.
+    """
+    from groq import RateLimitError, APIConnectionError, InternalServerError
+
+    async with slots:
+        for attempt in range(max_retries):
             try:
-                response = analyze_tweet_chunks(chunks)
+                response = await analyze_tweet_chunks(chunk)
+                planner.grow(len(chunk))
+                return response
+            except TruncatedResponse:
+                if len(chunk) == 1:
+                    LOG.warning("Response truncated for a single tweet, skipping it")
+                    return None
+                planner.shrink(len(chunk))
                 break
             except FailedToParseJSON:
-                continue
-        if response and "results" in response:
-            messages.extend(response["results"])
-    return messages
-
-def generalize_reasons(reasons):
-    message = llm.chat.completions.create(
-        messages=[
+                LOG.warning(f"Failed to parse response, attempt {attempt + 1}")
+                await asyncio.sleep(uniform(0, 0.5 * 2**attempt))
+            except RateLimitError as e:
+                LOG.warning(f"Rate limited by Groq, attempt {attempt + 1}")
+                rate_limiter.backoff(e.response.headers, attempt)
+            except (APIConnectionError, InternalServerError) as e:
+                LOG.warning(f"Groq request failed: {e}, attempt {attempt + 1}")
+                await asyncio.sleep(uniform(0, 2**attempt))
+        else:
+            return None
+
+    half = len(chunk) // 2
+    responses = await asyncio.gather(
+        analyze_chunk(chunk[:half], slots, max_retries),
+        analyze_chunk(chunk[half:], slots, max_retries),
+    )
+    return {
+        "results": [
+            result
+            for response in responses
+            if response
+            for result in response.get("results", [])
+        ]
+    }
+
+
+async def analyze_in_bulk(tweets, concurrency: int = LLM_CONCURRENCY, on_results=None):
+    """
+    Analyze tweets in token-budgeted chunks with up to `concurrency` requests
+    in flight. Only tweets whose text was not classified before, and that the
+    local triage could not clear, are sent to the LLM. Results are returned
+    in the order of the tweets.
+
+    `on_results` is awaited with each batch of results as it becomes
+    available: cached and locally triaged results first, then each chunk.
+    """
+    tweets = list(tweets)
+    keys = [classification_key(tweet["text"]) for tweet in tweets]
+    cached = await classification_cache.aget_many(keys)
+
+    # Send each unseen text once, even if several tweets share it
+    pending = {}
+    ids_by_key = {}
+    for tweet, key in zip(tweets, keys):
+        ids_by_key.setdefault(key, []).append(tweet["rest_id"])
+        if key not in cached and key not in pending:
+            pending[key] = tweet
+    LOG.info(f"{len(tweets) - len(pending)} of {len(tweets)} tweets served from cache")
+
+    # Clear obviously benign tweets locally, their results are not cached
+    escalate, local = await triage.asplit(list(pending.values()))
+
+    key_by_id = {str(tweet["rest_id"]): key for key, tweet in pending.items()}
+    for result in local:
+        cached[key_by_id[str(result.pop("tweetId"))]] = result
+
+    def expand(results: dict) -> list:
+        return [
+            {**result, "tweetId": rest_id}
+            for key, result in results.items()
+            for rest_id in ids_by_key[key]
+        ]
+
+    if on_results and cached:
+        await on_results(expand(cached))
+
+    analyzed, unmatched = {}, []
+
+    async def process(chunk):
+        response = await analyze_chunk(chunk, slots)
+        if not response or "results" not in response:
+            return
+        new, stray = {}, []
+        for result in response["results"]:
+            key = key_by_id.get(str(result.get("tweetId")))
+            if key:
+                new[key] = {k: v for k, v in result.items() if k != "tweetId"}
+            else:
+                stray.append(result)
+        analyzed.update(new)
+        unmatched.extend(stray)
+        if on_results:
+            await on_results(expand(new) + stray)
+
+    slots = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*(process(chunk) for chunk in planner.plan(escalate)))
+
+    await classification_cache.aset_many(analyzed)
+    cached.update(analyzed)
+
+    messages = []
+    for tweet, key in zip(tweets, keys):
+        if key in cached:
+            messages.append({**cached[key], "tweetId": tweet["rest_id"]})
+    return messages + unmatched
+
+
+async def generalize_reasons(reasons):
+    message = await complete(
+        [
             {"role": "system", "content": "Summarize the main reason for flagging these tweets in a single, concise sentence."},
             {"role": "user", "content": f"Based on these reasons, provide a one-line summary of why these tweets were flagged: {json.dumps(reasons)}"},
-        ],
-        model=GROQ_MODEL,
+        ]
     )
     return message.choices[0].message.content.strip()
-def summarise_output(tweets, chunk_size: int = 10):
-    output = {}
-    results = analyze_in_bulk(tweets, chunk_size)
-    reasons = []
-    for result in results:
-        for key, value in result.items():
-            if key == "reason":
-                reasons.append(value)
-                continue
-            if not isinstance(value, (int, float)):
-                continue
-            if key not in output:
-                output[key] = value
-            else:
-                output[key] += value
 
-    for key, value in output.items():
-        output[key] = value / len(results)
 
-    general_message = generalize_reasons(reasons)
-    output["general_message"] = general_message
+async def summarise_output(tweets, on_update=None, update_interval: float = 0.5):
+    """
+    Aggregate the analysis of the tweets into a report as results arrive.
+
+    Partial reports are passed to `on_update`, at most every
+    `update_interval` seconds, while flagged reasons are summarized in the
+    background.
+    """
+    tweets = list(tweets)
+    report = ReportAggregator(total=len(tweets))
+    reasons = ReasonSummarizer(generalize_reasons, estimate_tokens)
+    last_update = 0.0
+
+    async def on_results(results):
+        nonlocal last_update
+        report.add(results)
+        reasons.add([result.get("reason") for result in results])
+        if on_update and monotonic() - last_update >= update_interval:
+            last_update = monotonic()
+            await on_update({**report.snapshot(), "partial": True})
+
+    await analyze_in_bulk(tweets, on_results=on_results)
 
+    output = report.snapshot()
+    output["general_message"] = await reasons.result()
+    # Some reasons could not be summarized and are quoted instead
+    output["general_message_partial"] = bool(reasons.failed)
     return output
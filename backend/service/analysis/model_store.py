@@ -0,0 +1,365 @@
+"""
+Versioned, memory-mappable artifacts of the hate speech model.
+
+The RandomForest is exported as flat numpy arrays, loaded with
+`mmap_mode="r"`, so every worker process shares one copy of the trees in the
+page cache instead of unpickling its own. Each version lives in its own
+directory with a manifest of checksums, and a `CURRENT` pointer selects the
+active one.
+
+    models/
+        CURRENT
+        20240101-120000/
+            manifest.json
+            vectorizer.joblib
+            children_left.npy
+            ...
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import threading
+from hashlib import sha256
+from logging import getLogger
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.ensemble import RandomForestClassifier
+
+LOG = getLogger(__name__)
+
+FORMAT_VERSION = 1
+POINTER = "CURRENT"
+MANIFEST = "manifest.json"
+VECTORIZER = "vectorizer.joblib"
+
+# Files of the models saved before versioned artifacts
+LEGACY_MODEL = "hate_speech_model.joblib"
+LEGACY_VECTORIZER = "tfidf_vectorizer.joblib"
+LEGACY_SCORE = "model_score.txt"
+
+
+class ModelIntegrityError(Exception):
+    pass
+
+
+class ForestArrays:
+    """
+    Array-backed copy of a fitted RandomForestClassifier, predicting the same
+    probabilities as the forest it was exported from.
+
+    The nodes of all trees are concatenated, children indices point into the
+    concatenated arrays and features index the `used_features` columns only.
+    """
+
+    ARRAYS = (
+        "children_left",
+        "children_right",
+        "feature",
+        "threshold",
+        "proba",
+        "roots",
+        "used_features",
+        "classes",
+        "feature_importances",
+    )
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.classes_ = self.classes
+        self.feature_importances_ = self.feature_importances
+
+    @classmethod
+    def from_forest(cls, model: RandomForestClassifier) -> "ForestArrays":
+        import numpy as np
+
+        left, right, feature, threshold, proba, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            roots.append(offset)
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feature.append(np.where(is_leaf, -1, tree.feature))
+            threshold.append(tree.threshold)
+            value = tree.value[:, 0, :]
+            proba.append(value / value.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+
+        feature = np.concatenate(feature)
+        used = np.unique(feature[feature >= 0])
+        if not len(used):
+            used = np.zeros(1, dtype=np.int64)
+
+        return cls(
+            {
+                "children_left": np.concatenate(left).astype(np.int64),
+                "children_right": np.concatenate(right).astype(np.int64),
+                # Leaves point at column 0, which is never compared
+                "feature": np.where(
+                    feature >= 0, np.searchsorted(used, feature), 0
+                ).astype(np.int64),
+                "threshold": np.concatenate(threshold).astype(np.float64),
+                "proba": np.concatenate(proba).astype(np.float64),
+                "roots": np.asarray(roots, dtype=np.int64),
+                "used_features": used.astype(np.int64),
+                "classes": np.asarray(model.classes_),
+                "feature_importances": np.asarray(model.feature_importances_),
+            }
+        )
+
+    def predict_proba(self, X, batch_size: int = 1024) -> np.ndarray:
+        import numpy as np
+
+        n_samples = X.shape[0]
+        output = np.empty((n_samples, self.proba.shape[1]), dtype=np.float64)
+        for start in range(0, n_samples, batch_size):
+            batch = X[start : start + batch_size][:, self.used_features]
+            dense = batch.toarray() if hasattr(batch, "toarray") else np.asarray(batch)
+            # Trees compare float32 features, as sklearn does
+            dense = dense.astype(np.float32)
+
+            rows = np.arange(dense.shape[0])[:, None]
+            nodes = np.tile(self.roots, (dense.shape[0], 1))
+            while True:
+                left = self.children_left[nodes]
+                internal = left != -1
+                if not internal.any():
+                    break
+                go_left = dense[rows, self.feature[nodes]] <= self.threshold[nodes]
+                nodes = np.where(
+                    internal,
+                    np.where(go_left, left, self.children_right[nodes]),
+                    nodes,
+                )
+            output[start : start + dense.shape[0]] = self.proba[nodes].mean(axis=1)
+        return output
+
+
+def file_checksum(path: str) -> str:
+    digest = sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def current_version(model_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(model_dir, POINTER), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_artifact(
+    model: RandomForestClassifier,
+    vectorizer: TfidfVectorizer,
+    score: float,
+    model_dir: str,
+    activate: bool = True,
+) -> str:
+    """
+    Write the model as a new version and, with `activate`, point `CURRENT`
+    at it. Returns the version.
+    """
+    import numpy as np
+    import joblib
+
+    version = time.strftime("%Y%m%d-%H%M%S")
+    while os.path.exists(os.path.join(model_dir, version)):
+        version += "-1"
+
+    staging = os.path.join(model_dir, f".{version}.tmp")
+    os.makedirs(staging)
+
+    forest = ForestArrays.from_forest(model)
+    for name in ForestArrays.ARRAYS:
+        np.save(os.path.join(staging, f"{name}.npy"), getattr(forest, name))
+
+    # Only needed for introspection, and can be larger than the vocabulary
+    if hasattr(vectorizer, "stop_words_"):
+        del vectorizer.stop_words_
+    joblib.dump(vectorizer, os.path.join(staging, VECTORIZER))
+
+    files = sorted(os.listdir(staging))
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created": time.time(),
+        "score": float(score),
+        "n_estimators": len(model.estimators_),
+        "files": {name: file_checksum(os.path.join(staging, name)) for name in files},
+    }
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.rename(staging, os.path.join(model_dir, version))
+    if activate:
+        activate_version(model_dir, version)
+    LOG.info(f"Saved model version {version} in {model_dir}")
+    return version
+
+
+def check_version(model_dir: str, version: str) -> str:
+    """
+    Path of a saved version. Only names of existing version directories are
+    accepted, so a version can never point outside `model_dir`.
+    """
+    if (
+        not version
+        or version.startswith(".")
+        or os.sep in version
+        or (os.altsep and os.altsep in version)
+        or version not in os.listdir(model_dir)
+        or not os.path.exists(os.path.join(model_dir, version, MANIFEST))
+    ):
+        raise FileNotFoundError(f"No model version {version} in {model_dir}")
+    return os.path.join(model_dir, version)
+
+
+def activate_version(model_dir: str, version: str):
+    check_version(model_dir, version)
+    pointer = os.path.join(model_dir, POINTER)
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+
+
+def load_artifact(
+    model_dir: str, version: str = None, verify: bool = True
+) -> Tuple[ForestArrays, TfidfVectorizer, dict]:
+    """
+    Load a model version, the current one by default, memory-mapping its
+    arrays. Falls back to the legacy pickled model when no version exists.
+    """
+    import numpy as np
+    import joblib
+
+    version = version or current_version(model_dir)
+    if version is None:
+        return load_legacy(model_dir)
+
+    path = check_version(model_dir, version)
+    with open(os.path.join(path, MANIFEST), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ModelIntegrityError(
+            f"Unsupported model format {manifest.get('format')} for {version}"
+        )
+    if verify:
+        for name, checksum in manifest["files"].items():
+            if file_checksum(os.path.join(path, name)) != checksum:
+                raise ModelIntegrityError(f"Checksum mismatch for {version}/{name}")
+
+    forest = ForestArrays(
+        {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ForestArrays.ARRAYS
+        }
+    )
+    vectorizer = joblib.load(os.path.join(path, VECTORIZER), mmap_mode="r")
+    return forest, vectorizer, manifest
+
+
+def load_legacy(model_dir: str) -> Tuple[RandomForestClassifier, TfidfVectorizer, dict]:
+    import joblib
+
+    model = joblib.load(os.path.join(model_dir, LEGACY_MODEL))
+    vectorizer = joblib.load(os.path.join(model_dir, LEGACY_VECTORIZER))
+    with open(os.path.join(model_dir, LEGACY_SCORE), "r") as f:
+        score = float(f.read())
+    return model, vectorizer, {"version": "legacy", "score": score}
+
+
+class ModelRegistry:
+    """
+    Holds the loaded model and swaps in a new version without a restart,
+    either on `reload` or when the `CURRENT` pointer changes on disk.
+    """
+
+    def __init__(self, model_dir: str) -> None:
+        self.model_dir = model_dir
+
+        self._current: Tuple[object, object, dict] = None
+        self._pointer_mtime: float = None
+        self._attempted = False
+        self._lock = threading.Lock()
+
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    @property
+    def current(self) -> Tuple[object, object, Optional[dict]]:
+        return self._current or (None, None, None)
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.stat(os.path.join(self.model_dir, POINTER)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> bool:
+        """
+        Load the current version once, returning whether a model is available.
+        """
+        if not self._attempted:
+            self._attempted = True
+            try:
+                self.reload()
+            except (OSError, ImportError, ModelIntegrityError) as e:
+                LOG.warning(f"Failed to load hate speech model: {e}")
+        return self._current is not None
+
+    def reload(self, version: str = None) -> dict:
+        """
+        Load `version`, or the current one, and swap it in. The previous model
+        stays in use, and `CURRENT` is left untouched, if loading fails.
+        """
+        with self._lock:
+            mtime = self._mtime()
+            try:
+                model, vectorizer, manifest = load_artifact(self.model_dir, version)
+                # Only point other workers at a version that loaded and verified
+                if version:
+                    activate_version(self.model_dir, version)
+                    mtime = self._mtime()
+            except Exception:
+                self.failed_reloads += 1
+                raise
+            self._current = (model, vectorizer, manifest)
+            self._pointer_mtime = mtime
+            self.reloads += 1
+        LOG.info(f"Loaded hate speech model version {manifest['version']}")
+        return manifest
+
+    def refresh(self) -> bool:
+        """
+        Reload if another process moved the `CURRENT` pointer.
+        """
+        if self._current is None or self._mtime() == self._pointer_mtime:
+            return False
+        try:
+            self.reload()
+        except Exception as e:
+            LOG.error(f"Failed to reload hate speech model: {e}")
+            # Don't retry the same broken version on every call
+            self._pointer_mtime = self._mtime()
+            return False
+        return True
+
+    def stats(self) -> dict:
+        manifest = self.current[2] or {}
+        return {
+            "version": manifest.get("version"),
+            "score": manifest.get("score"),
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+        }
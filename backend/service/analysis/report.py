@@ -0,0 +1,149 @@
+"""
+Incremental aggregation of tweet classifications into a report.
+"""
+
+import asyncio
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, List
+
+LOG = getLogger(__name__)
+
+# Number of equal-width buckets of the per-category distributions over [0, 1]
+DISTRIBUTION_BUCKETS = 5
+# Token budget of the reasons summarized by a single request
+REASON_BATCH_TOKENS = 1500
+# Longer reasons are cut, so a single one cannot blow the budget
+MAX_REASON_CHARS = 500
+
+
+class ReportAggregator:
+    """
+    Running means, maxima and distributions of the scores of each category,
+    updated as results arrive. Each mean is over the results that score its
+    category, so results triaged locally do not count as clean for the
+    categories they were never assessed for.
+    """
+
+    def __init__(self, total: int = None) -> None:
+        self.total = total
+        self.count = 0
+        self.triaged = 0
+        self.counts: Dict[str, int] = {}
+        self.sums: Dict[str, float] = {}
+        self.maxima: Dict[str, float] = {}
+        self.distributions: Dict[str, List[int]] = {}
+
+    def add(self, results: List[dict]):
+        for result in results:
+            self.count += 1
+            if result.get("triaged"):
+                self.triaged += 1
+            for key, value in result.items():
+                if key == "tweetId" or isinstance(value, bool):
+                    continue
+                if not isinstance(value, (int, float)):
+                    continue
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.sums[key] = self.sums.get(key, 0) + value
+                self.maxima[key] = max(self.maxima.get(key, value), value)
+                bucket = min(max(int(value * DISTRIBUTION_BUCKETS), 0), DISTRIBUTION_BUCKETS - 1)
+                self.distributions.setdefault(key, [0] * DISTRIBUTION_BUCKETS)[bucket] += 1
+
+    def snapshot(self) -> dict:
+        """
+        The report so far, with the means of each category at the top level.
+        """
+        report = {key: value / self.counts[key] for key, value in self.sums.items()}
+        report["max"] = dict(self.maxima)
+        report["distribution"] = {
+            key: list(counts) for key, counts in self.distributions.items()
+        }
+        report["analyzed"] = self.count
+        report["triaged"] = self.triaged
+        report["total"] = self.total
+        return report
+
+
+class ReasonSummarizer:
+    """
+    Summarizes reasons map-reduce style: reasons are summarized in batches
+    while results stream in, and the summaries are summarized again level by
+    level, so that no prompt grows beyond REASON_BATCH_TOKENS. Every batch
+    but the last of a level holds at least two texts and every summary is
+    cut to MAX_REASON_CHARS, so each level is smaller than the one below.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[List[str]], Awaitable[str]],
+        estimate_tokens: Callable[[str], int],
+        batch_tokens: int = REASON_BATCH_TOKENS,
+    ) -> None:
+        self.summarize = summarize
+        self.estimate_tokens = estimate_tokens
+        self.batch_tokens = batch_tokens
+
+        self.levels: List[List[str]] = [[]]
+        self._level_tokens: List[int] = [0]
+        self._tasks: List[asyncio.Task] = []
+        # Batches whose summary fell back to the reasons themselves
+        self.failed = 0
+
+    def add(self, reasons: List[str]):
+        for reason in reasons:
+            if reason:
+                self._push(0, reason[:MAX_REASON_CHARS])
+
+    def _push(self, level: int, text: str):
+        if level == len(self.levels):
+            self.levels.append([])
+            self._level_tokens.append(0)
+
+        tokens = self.estimate_tokens(text)
+        if (
+            len(self.levels[level]) > 1
+            and self._level_tokens[level] + tokens > self.batch_tokens
+        ):
+            self._flush(level)
+        self.levels[level].append(text)
+        self._level_tokens[level] += tokens
+
+    def _flush(self, level: int):
+        batch, self.levels[level] = self.levels[level], []
+        self._level_tokens[level] = 0
+        self._tasks.append(asyncio.ensure_future(self._map(level, batch)))
+
+    async def _map(self, level: int, batch: List[str]):
+        if len(batch) == 1:
+            # Nothing to merge, carry it up as is
+            self._push(level + 1, batch[0])
+            return
+        try:
+            summary = await self.summarize(batch)
+        except Exception as e:
+            LOG.error(f"Failed to summarize {len(batch)} reasons: {e}")
+            self.failed += 1
+            # Keep a bit of every reason rather than a single tweet's
+            summary = " ".join(text[: MAX_REASON_CHARS // len(batch)] for text in batch)
+        self._push(level + 1, summary[:MAX_REASON_CHARS])
+
+    async def _drain(self):
+        while self._tasks:
+            tasks, self._tasks = self._tasks, []
+            await asyncio.gather(*tasks)
+
+    async def result(self) -> str:
+        """
+        Reduce everything added so far into a single summary.
+        """
+        level = 0
+        while True:
+            await self._drain()
+            top = level == len(self.levels) - 1
+            if top and not self.levels[level]:
+                return ""
+            if top and level > 0 and len(self.levels[level]) == 1:
+                return self.levels[level][0]
+            if self.levels[level]:
+                self._flush(level)
+            level += 1
@@ -0,0 +1,105 @@
+"""
+Local triage of tweets with the hate speech model, ahead of the LLM.
+"""
+
+from logging import getLogger
+from typing import List, Tuple
+from service.config import HATE_SPEECH_MODEL_DIR, TRIAGE_ENABLED, TRIAGE_THRESHOLD
+from service.analysis.model_store import ModelRegistry
+from service.executors import run_io
+
+LOG = getLogger(__name__)
+
+
+class Triage:
+    """
+    Scores whole batches of tweets with the local TF-IDF + RandomForest model,
+    so that only uncertain or risky tweets are sent to the LLM.
+    """
+
+    def __init__(
+        self,
+        model_dir: str = HATE_SPEECH_MODEL_DIR,
+        threshold: float = TRIAGE_THRESHOLD,
+        enabled: bool = TRIAGE_ENABLED,
+    ) -> None:
+        self.threshold = threshold
+        self.enabled = enabled
+        self.registry = ModelRegistry(model_dir)
+        self._nltk_ready: bool = None
+
+        self.cleared = 0
+        self.escalated = 0
+
+    def load(self) -> bool:
+        if not self.enabled:
+            return False
+        if self._nltk_ready is None:
+            from service.analysis.tweets import check_nltk
+
+            self._nltk_ready = check_nltk()
+        if not self._nltk_ready:
+            # Every text would preprocess to "" and be cleared
+            LOG.error("Triage disabled, NLTK data is missing")
+            self.enabled = False
+            return False
+        if not self.registry.load():
+            return False
+        # Pick up a model retrained by another process
+        self.registry.refresh()
+        return True
+
+    def score(self, texts: List[str]):
+        """
+        Hate speech probability of each text, computed in a single batch.
+        """
+        from service.analysis.tweets import predict_hate_speech_proba
+
+        model, vectorizer, _ = self.registry.current
+        return predict_hate_speech_proba(texts, model, vectorizer)
+
+    def split(self, tweets: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """
+        Split tweets into those to send to the LLM and locally produced
+        results for the others. Local results only hold the profanity score
+        and are flagged `triaged`.
+        """
+        if not tweets or not self.load():
+            return tweets, []
+
+        scores = self.score([tweet["text"] for tweet in tweets])
+        escalate, results = [], []
+        for tweet, score in zip(tweets, scores):
+            if score >= self.threshold:
+                escalate.append(tweet)
+                continue
+            # The model only assesses hate speech, the other categories are
+            # left out rather than reported as clean
+            results.append(
+                {
+                    "profanity_detection": round(float(score), 4),
+                    "tweetId": tweet["rest_id"],
+                    "reason": "",
+                    "triaged": True,
+                }
+            )
+
+        self.cleared += len(results)
+        self.escalated += len(escalate)
+        LOG.info(f"Triage cleared {len(results)} of {len(tweets)} tweets locally")
+        return escalate, results
+
+    async def asplit(self, tweets: List[dict]) -> Tuple[List[dict], List[dict]]:
+        return await run_io(self.split, tweets)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled and self.registry.current[0] is not None,
+            "threshold": self.threshold,
+            "cleared": self.cleared,
+            "escalated": self.escalated,
+            "model": self.registry.stats(),
+        }
+
+
+triage = Triage()
@@ -2,46 +2,98 @@
 This module contains the code for robust and accurate hate speech detection.
 """
 
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import (
-    train_test_split,
-    cross_val_score,
-    RandomizedSearchCV,
-)
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics import accuracy_score, classification_report, make_scorer, f1_score
-from sklearn.ensemble import RandomForestClassifier
+from __future__ import annotations
+
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
 import logging
-from typing import Tuple, Optional
-import joblib
+from typing import TYPE_CHECKING, List, Sequence, Tuple, Optional
+from functools import lru_cache
+from contextlib import contextmanager
+from multiprocessing import Pool
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from hashlib import sha256
+import gc
 import os
-from imblearn.over_sampling import SMOTE
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import shutil
+import sys
+import threading
+import time
+import tempfile
+from service.config import NLTK_DATA_DIR, DATASET_CACHE_DIR
+
+# Heavy dependencies (pandas, sklearn, nltk, ...) are imported on first use,
+# so importing this module stays cheap and needs no network.
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.ensemble import RandomForestClassifier
+
+NLTK_RESOURCES = ["stopwords", "wordnet", "punkt", "punkt_tab"]
+
+
+@lru_cache(maxsize=None)
+def get_nltk():
+    """
+    Import nltk, reading its data from the local NLTK_DATA_DIR bundle only.
+    """
+    import nltk
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+    nltk.data.path[:] = [os.path.abspath(NLTK_DATA_DIR)]
+    return nltk
 
 
-# Download necessary NLTK data
+# Download necessary NLTK data into the local bundle
 def download_nltk_resources():
-    resources = ["stopwords", "wordnet", "punkt", "punkt_tab"]
-    for resource in resources:
+    nltk = get_nltk()
+    for resource in NLTK_RESOURCES:
         try:
-            nltk.download(resource, quiet=True)
+            nltk.download(resource, download_dir=NLTK_DATA_DIR, quiet=True)
             logging.info(f"Successfully downloaded NLTK resource: {resource}")
         except Exception as e:
             logging.error(f"Failed to download NLTK resource {resource}: {str(e)}")
 
 
-download_nltk_resources()
+# Removes URLs, user @ references, '#', punctuations and numbers
+CLEAN_PATTERN = re.compile(r"http\S+|www\S+|https\S+|\@\w+|\#|[^\w\s]|\d+")
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> frozenset:
+    get_nltk()
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words("english"))
+
+
+@lru_cache(maxsize=None)
+def get_lemmatizer():
+    get_nltk()
+    from nltk.stem import WordNetLemmatizer
+
+    return WordNetLemmatizer()
+
+
+@lru_cache(maxsize=100_000)
+def lemmatize(token: str) -> str:
+    return get_lemmatizer().lemmatize(token)
+
+
+def check_nltk() -> bool:
+    """
+    Whether nltk and the data preprocess_text needs are available.
+    """
+    try:
+        get_stop_words()
+        lemmatize("warming")
+        get_nltk().word_tokenize("warm up")
+    except LookupError as e:
+        logging.error(f"NLTK data missing, run download_nltk_resources: {e}")
+        return False
+    except ImportError as e:
+        logging.error(f"NLTK is not installed: {e}")
+        return False
+    return True
 
 
 def preprocess_text(text: str) -> str:
@@ -49,88 +101,299 @@ def preprocess_text(text: str) -> str:
         # Convert to lowercase
         text = text.lower()
         # Remove URLs, user @ references, '#', punctuations, numbers, and whitespaces
-        text = re.sub(r"http\S+|www\S+|https\S+|\@\w+|\#|[^\w\s]|\d+", "", text)
+        text = CLEAN_PATTERN.sub("", text)
         text = text.strip()
 
         # Tokenization
-        tokens = nltk.word_tokenize(text)
+        tokens = get_nltk().word_tokenize(text)
 
         # Remove stopwords and apply lemmatization
-        stop_words = set(stopwords.words("english"))
-        lemmatizer = WordNetLemmatizer()
-        tokens = [
-            lemmatizer.lemmatize(token) for token in tokens if token not in stop_words
-        ]
+        stop_words = get_stop_words()
+        tokens = [lemmatize(token) for token in tokens if token not in stop_words]
 
         return " ".join(tokens)
+    except LookupError:
+        # Missing NLTK data would turn every text into "", fail loudly instead
+        raise
     except Exception as e:
         logging.error(f"Error in text preprocessing: {str(e)}")
         return ""
 
 
+def preprocess_texts(texts: Sequence[str], n_jobs: int = 1) -> List[str]:
+    """
+    Preprocess a batch of texts, optionally spread over `n_jobs` processes.
+    """
+    if n_jobs == 1 or len(texts) < 1000:
+        return [preprocess_text(text) for text in texts]
+
+    with Pool(n_jobs if n_jobs > 0 else None) as pool:
+        return pool.map(preprocess_text, texts, chunksize=500)
+
+
+DATASET_CONFIGS = [
+    ("python/dataset/hate_speech/twitter_parsed_dataset.csv", "text", "class"),
+    ("python/dataset/hate_speech/TwitterHate.csv", "tweet", "class"),
+    ("python/dataset/hate_speech/aggression_parsed_dataset.csv", "text", "class"),
+    (
+        "python/dataset/hate_speech/gate_aggression_parsed_dataset.csv",
+        "text",
+        "class",
+    ),
+    ("python/dataset/hate_speech/attack_parsed_dataset.csv", "text", "class"),
+    ("python/dataset/hate_speech/toxicity_parsed_dataset.csv", "text", "class"),
+    (
+        "python/dataset/hate_speech/twitter_sexism_parsed_dataset.csv",
+        "text",
+        "class",
+    ),
+    ("python/dataset/hate_speech/kaggle_parsed_dataset.csv", "text", "class"),
+]
+
+# Bump whenever preprocess_text changes, so cached corpora are rebuilt
+PREPROCESS_VERSION = "1"
+
+# Rows read from a CSV and sent to a worker at once
+CHUNK_ROWS = 5000
+
+
 def load_and_preprocess_dataset(
-    file_path: str, text_column: str, label_column: str
+    file_path: str, text_column: str, label_column: str, n_jobs: int = 1
 ) -> pd.DataFrame:
+    import pandas as pd
+
     try:
-        df = pd.read_csv(file_path)
-        df[text_column].head()
-        df["processed_text"] = df[text_column].apply(preprocess_text)
-        df["label"] = df[label_column]
-        return df[["processed_text", "label"]]
+        df = pd.read_csv(file_path, usecols=[text_column, label_column])
+        df = df.dropna(subset=[text_column])
+        texts = df[text_column].astype(str).tolist()
+        return pd.DataFrame(
+            {
+                "processed_text": preprocess_texts(texts, n_jobs=n_jobs),
+                "label": df[label_column].tolist(),
+            }
+        )
     except Exception as e:
         logging.error(f"Error loading or preprocessing data from {file_path}: {str(e)}")
         return pd.DataFrame()
 
 
-def load_and_merge_datasets() -> pd.DataFrame:
-
-    dataset_configs = [
-        ("python/dataset/hate_speech/twitter_parsed_dataset.csv", "text", "class"),
-        ("python/dataset/hate_speech/TwitterHate.csv", "tweet", "class"),
-        ("python/dataset/hate_speech/aggression_parsed_dataset.csv", "text", "class"),
-        (
-            "python/dataset/hate_speech/gate_aggression_parsed_dataset.csv",
-            "text",
-            "class",
-        ),
-        ("python/dataset/hate_speech/attack_parsed_dataset.csv", "text", "class"),
-        ("python/dataset/hate_speech/toxicity_parsed_dataset.csv", "text", "class"),
-        ("python/dataset/hate_speech/TwitterHate.csv", "tweet", "class"),
-        (
-            "python/dataset/hate_speech/twitter_sexism_parsed_dataset.csv",
-            "text",
-            "class",
-        ),
-        ("python/dataset/hate_speech/kaggle_parsed_dataset.csv", "text", "class"),
-    ]
-
-    dataframes = []
+def dataset_fingerprint(dataset_configs) -> str:
+    """
+    Hash of the dataset files (path, size, modification time and columns)
+    and of the preprocessing version.
+    """
+    digest = sha256(PREPROCESS_VERSION.encode())
     for file_path, text_column, label_column in dataset_configs:
-        df = load_and_preprocess_dataset(file_path, "text", "label")
-        if not df.empty:
-            dataframes.append(df)
+        stat = os.stat(file_path) if os.path.exists(file_path) else None
+        digest.update(
+            repr(
+                (
+                    file_path,
+                    text_column,
+                    label_column,
+                    stat and (stat.st_size, stat.st_mtime_ns),
+                )
+            ).encode()
+        )
+    return digest.hexdigest()[:16]
+
+
+def read_dataset_chunks(dataset_configs):
+    """
+    Yield (texts, labels) chunks of the datasets, skipping texts seen before.
+    """
+    import pandas as pd
+
+    seen = set()
+    for file_path, text_column, label_column in dataset_configs:
+        try:
+            for chunk in pd.read_csv(
+                file_path, usecols=[text_column, label_column], chunksize=CHUNK_ROWS
+            ):
+                chunk = chunk.dropna(subset=[text_column])
+                texts, labels = [], []
+                for text, label in zip(chunk[text_column].astype(str), chunk[label_column]):
+                    # The same text appears in several datasets
+                    if text in seen:
+                        continue
+                    seen.add(text)
+                    texts.append(text)
+                    labels.append(label)
+                if texts:
+                    yield texts, labels
+        except Exception as e:
+            logging.error(f"Error loading data from {file_path}: {str(e)}")
+
 
-    if not dataframes:
+def load_and_merge_datasets(
+    dataset_configs=DATASET_CONFIGS,
+    n_jobs: int = -1,
+    cache_dir: str = DATASET_CACHE_DIR,
+) -> pd.DataFrame:
+    """
+    Load, deduplicate and preprocess all datasets into one corpus.
+
+    CSVs are read in chunks which are preprocessed in a process pool, with
+    at most two chunks per worker in flight. The result is stored as Parquet
+    keyed by `dataset_fingerprint`, so later runs on the same sources skip
+    preprocessing.
+    """
+    import pandas as pd
+
+    dataset_configs = list(dict.fromkeys(dataset_configs))
+    cache_path = os.path.join(
+        cache_dir, f"corpus-{dataset_fingerprint(dataset_configs)}.parquet"
+    )
+    if os.path.exists(cache_path):
+        merged_df = pd.read_parquet(cache_path)
+        logging.info(f"Loaded preprocessed corpus {cache_path}: {merged_df.shape}")
+        return merged_df
+
+    workers = n_jobs if n_jobs > 0 else os.cpu_count() or 1
+    processed, labels = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def collect(futures):
+            for future in futures:
+                processed[pending.pop(future)] = future.result()
+
+        for texts, chunk_labels in read_dataset_chunks(dataset_configs):
+            # Keep only a few chunks in flight, so the pickled chunks waiting
+            # for a worker do not pile up in memory
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(preprocess_texts, texts)] = len(processed)
+            processed.append(None)
+            labels.append(chunk_labels)
+        collect(list(pending))
+
+    if not processed:
         raise ValueError("No datasets were successfully loaded.")
 
-    merged_df = pd.concat(dataframes, ignore_index=True)
+    merged_df = pd.DataFrame(
+        {
+            "processed_text": [text for texts in processed for text in texts],
+            "label": [label for chunk in labels for label in chunk],
+        }
+    )
+    merged_df = merged_df.drop_duplicates().reset_index(drop=True)
     logging.info(f"Merged dataset shape: {merged_df.shape}")
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        merged_df.to_parquet(cache_path, index=False)
+        logging.info(f"Preprocessed corpus cached in {cache_path}")
+    except ImportError as e:
+        logging.warning(f"Parquet support missing, corpus not cached: {str(e)}")
+
     return merged_df
 
 
+# Seconds between two memory samples of a training stage
+RSS_SAMPLE_INTERVAL = 0.1
+
+
+class RssSampler:
+    """
+    Samples, in a background thread, the resident memory of this process and
+    of its live workers, keeping the peaks seen since it was started.
+    Requires psutil, and samples nothing without it.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self.workers_peak_mb: Optional[float] = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread = None
+
+    def sample(self, process):
+        import psutil
+
+        workers = 0
+        for child in process.children(recursive=True):
+            try:
+                workers += child.memory_info().rss
+            except psutil.Error:
+                continue
+        own = process.memory_info().rss / (1024 * 1024)
+        workers /= 1024 * 1024
+        self.peak_mb = max(self.peak_mb or 0, own)
+        self.workers_peak_mb = max(self.workers_peak_mb or 0, workers)
+
+    def _run(self):
+        import psutil
+
+        process = psutil.Process()
+        self.sample(process)
+        while not self._stopped.wait(self.interval):
+            self.sample(process)
+        # Catch the end of stages shorter than the interval
+        self.sample(process)
+
+    def start(self) -> "RssSampler":
+        try:
+            import psutil  # noqa: F401
+        except ImportError:
+            return self
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+@contextmanager
+def training_stage(name: str):
+    start = time.perf_counter()
+    sampler = RssSampler().start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+    peak, workers_peak = sampler.peak_mb, sampler.workers_peak_mb
+    logging.info(
+        f"Stage '{name}' took {time.perf_counter() - start:.2f}s"
+        + (f", peak RSS {peak:.0f}MB" if peak is not None else "")
+        + (f", workers peak RSS {workers_peak:.0f}MB" if workers_peak else "")
+    )
+
+
 def train_hate_speech_model(
     data: pd.DataFrame,
+    memory_bounded: bool = False,
+    n_jobs: int = -1,
 ) -> Tuple[RandomForestClassifier, TfidfVectorizer, float]:
+    """
+    Train the TF-IDF + RandomForest model and return it with its mean
+    cross-validation F1 score.
+
+    With `memory_bounded`, the feature matrix stays sparse (float32) and is
+    shared with the search workers through a memory-mapped file, class
+    imbalance is handled with class weights instead of SMOTE, and
+    hyperparameters are tuned with successive halving.
+    """
+    import numpy as np
+    from sklearn.model_selection import RandomizedSearchCV
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.ensemble import RandomForestClassifier
+
     X = data["processed_text"]
     y = data["label"]
 
     # TF-IDF Vectorization
-    vectorizer = TfidfVectorizer(max_features=10000, ngram_range=(1, 2))
-    X_vectorized = vectorizer.fit_transform(X)
-
-    # Handle class imbalance
-    smote = SMOTE(random_state=42)
-    X_resampled, y_resampled = smote.fit_resample(X_vectorized, y)
+    with training_stage("vectorize"):
+        vectorizer = TfidfVectorizer(
+            max_features=10000,
+            ngram_range=(1, 2),
+            dtype=np.float32 if memory_bounded else np.float64,
+        )
+        X_vectorized = vectorizer.fit_transform(X)
 
     # Hyperparameter tuning
     param_dist = {
@@ -140,30 +403,66 @@ def train_hate_speech_model(
         "min_samples_leaf": [1, 2, 4],
     }
 
-    model = RandomForestClassifier(random_state=42)
-
-    random_search = RandomizedSearchCV(
-        model,
-        param_distributions=param_dist,
-        n_iter=10,
-        scoring="f1",
-        n_jobs=-1,
-        cv=5,
-        random_state=42,
-    )
-
-    random_search.fit(X_resampled, y_resampled)
-
-    best_model = random_search.best_estimator_
+    if memory_bounded:
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingRandomSearchCV
+        import joblib
 
-    # Cross-validation
-    cv_scores = cross_val_score(
-        best_model, X_resampled, y_resampled, cv=5, scoring="f1"
-    )
-    mean_cv_score = np.mean(cv_scores)
+        shared_dir = tempfile.mkdtemp()
+        X_train = y_train = None
+        try:
+            with training_stage("share"):
+                shared_path = os.path.join(shared_dir, "train.joblib")
+                joblib.dump((X_vectorized, np.asarray(y)), shared_path)
+                del X_vectorized
+                # Workers receive references to the memory-mapped arrays
+                # instead of their own pickled copy
+                X_train, y_train = joblib.load(shared_path, mmap_mode="r")
+
+            search = HalvingRandomSearchCV(
+                RandomForestClassifier(random_state=42, class_weight="balanced"),
+                param_distributions=param_dist,
+                n_candidates=10,
+                factor=3,
+                scoring="f1",
+                n_jobs=n_jobs,
+                cv=5,
+                random_state=42,
+            )
+            with training_stage("search"):
+                search.fit(X_train, y_train)
+        finally:
+            # Close the memory maps first, Windows cannot delete mapped files
+            X_train = y_train = None
+            gc.collect()
+            shutil.rmtree(shared_dir, ignore_errors=True)
+    else:
+        from imblearn.over_sampling import SMOTE
+
+        # Handle class imbalance
+        with training_stage("resample"):
+            smote = SMOTE(random_state=42)
+            X_resampled, y_resampled = smote.fit_resample(X_vectorized, y)
+
+        search = RandomizedSearchCV(
+            RandomForestClassifier(random_state=42),
+            param_distributions=param_dist,
+            n_iter=10,
+            scoring="f1",
+            n_jobs=n_jobs,
+            cv=5,
+            random_state=42,
+        )
+        with training_stage("search"):
+            search.fit(X_resampled, y_resampled)
+
+    best_model = search.best_estimator_
+
+    # The search already cross-validated the best parameters
+    mean_cv_score = search.cv_results_["mean_test_score"][search.best_index_]
 
     logging.info(f"Mean Cross-Validation F1 Score: {mean_cv_score}")
-    logging.info(f"Best Parameters: {random_search.best_params_}")
+    logging.info(f"Best Parameters: {search.best_params_}")
 
     return best_model, vectorizer, mean_cv_score
 
@@ -173,48 +472,100 @@ def save_model(
     vectorizer: TfidfVectorizer,
     score: float,
     model_dir: str = "models",
-):
+) -> str:
+    from service.analysis.model_store import save_artifact
+
     os.makedirs(model_dir, exist_ok=True)
-    joblib.dump(model, os.path.join(model_dir, "hate_speech_model.joblib"))
-    joblib.dump(vectorizer, os.path.join(model_dir, "tfidf_vectorizer.joblib"))
-    with open(os.path.join(model_dir, "model_score.txt"), "w") as f:
-        f.write(str(score))
-    logging.info(f"Model saved in {model_dir}")
+    version = save_artifact(model, vectorizer, score, model_dir)
+    logging.info(f"Model saved in {model_dir} as version {version}")
+    return version
 
 
 def load_model(
     model_dir: str = "models",
 ) -> Tuple[Optional[RandomForestClassifier], Optional[TfidfVectorizer], float]:
+    """
+    Load the current model version, with its trees memory-mapped.
+    """
+    from service.analysis.model_store import load_artifact
+
     try:
-        model = joblib.load(os.path.join(model_dir, "hate_speech_model.joblib"))
-        vectorizer = joblib.load(os.path.join(model_dir, "tfidf_vectorizer.joblib"))
-        with open(os.path.join(model_dir, "model_score.txt"), "r") as f:
-            score = float(f.read())
-        logging.info(f"Model loaded successfully from {model_dir}")
-        return model, vectorizer, score
+        model, vectorizer, manifest = load_artifact(model_dir)
+        logging.info(
+            f"Model {manifest['version']} loaded successfully from {model_dir}"
+        )
+        return model, vectorizer, manifest["score"]
     except Exception as e:
         logging.error(f"Error loading model: {str(e)}")
         return None, None, 0.0
 
 
+def predict_hate_speech_proba(
+    texts: Sequence[str],
+    model: RandomForestClassifier,
+    vectorizer: TfidfVectorizer,
+    n_jobs: int = 1,
+) -> np.ndarray:
+    """
+    Hate speech probability of each text, transformed and predicted as one
+    sparse matrix.
+    """
+    vectorized = vectorizer.transform(preprocess_texts(texts, n_jobs=n_jobs))
+    probabilities = model.predict_proba(vectorized)
+    classes = list(model.classes_)
+    # Assuming 1 is the hate speech class
+    return probabilities[:, classes.index(1) if 1 in classes else 1]
+
+
+def predict_hate_speech_batch(
+    texts: Sequence[str],
+    model: RandomForestClassifier,
+    vectorizer: TfidfVectorizer,
+    n_jobs: int = 1,
+) -> List[Tuple[str, float]]:
+    probabilities = predict_hate_speech_proba(texts, model, vectorizer, n_jobs)
+    return [
+        ("Hate Speech" if prob > 0.6 else "Not Hate Speech", float(prob))
+        for prob in probabilities
+    ]
+
+
 def predict_hate_speech(
     text: str, model: RandomForestClassifier, vectorizer: TfidfVectorizer
 ) -> Tuple[str, float]:
-    processed_text = preprocess_text(text)
-    vectorized_text = vectorizer.transform([processed_text])
-    prediction = model.predict(vectorized_text)
-    probability = model.predict_proba(vectorized_text)[0]
-    hate_speech_prob = probability[1]  # Assuming 1 is the hate speech class
+    result, hate_speech_prob = predict_hate_speech_batch([text], model, vectorizer)[0]
     logging.info(
-        f"Text: '{text}', Prediction: {prediction[0]}, Hate Speech Probability: {hate_speech_prob:.4f}"
-    )
-    return (
-        "Hate Speech" if hate_speech_prob > 0.6 else "Not Hate Speech",
-        hate_speech_prob,
+        f"Text: '{text}', Prediction: {result}, Hate Speech Probability: {hate_speech_prob:.4f}"
     )
+    return result, hate_speech_prob
+
+
+def benchmark_batch_prediction(
+    model: RandomForestClassifier,
+    vectorizer: TfidfVectorizer,
+    texts: Sequence[str],
+    batch_sizes: Sequence[int] = (1, 10, 100, 1000, 10_000, 100_000),
+    n_jobs: int = 1,
+) -> dict:
+    """
+    Measure prediction throughput, in texts per second, for each batch size.
+    `texts` are repeated as needed to fill the batches.
+    """
+    results = {}
+    for size in batch_sizes:
+        batch = [texts[i % len(texts)] for i in range(size)]
+        start = time.perf_counter()
+        predict_hate_speech_proba(batch, model, vectorizer, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        results[size] = size / elapsed
+        logging.info(f"Batch size {size}: {results[size]:.0f} texts/s")
+    return results
 
 
 def generate_wordcloud(model: RandomForestClassifier, vectorizer: TfidfVectorizer):
+    from wordcloud import WordCloud
+    import matplotlib.pyplot as plt
+
     # Get feature importances
     feature_importance = model.feature_importances_
     feature_names = vectorizer.get_feature_names_out()
@@ -241,13 +592,19 @@ def generate_wordcloud(model: RandomForestClassifier, vectorizer: TfidfVectorize
 
 # Example usage:
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    download_nltk_resources()
     try:
         model, vectorizer, score = load_model()
 
         if model is None or vectorizer is None:
             logging.info("No saved model found. Training a new model...")
             merged_data = load_and_merge_datasets()
-            model, vectorizer, score = train_hate_speech_model(merged_data)
+            model, vectorizer, score = train_hate_speech_model(
+                merged_data, memory_bounded="--memory-bounded" in sys.argv
+            )
             save_model(model, vectorizer, score)
         else:
             logging.info(f"Using saved model with score: {score}")
@@ -266,11 +623,14 @@ if __name__ == "__main__":
             "Fuck you",
         ]
 
-        for sample_text in sample_texts:
-            result, probability = predict_hate_speech(sample_text, model, vectorizer)
+        predictions = predict_hate_speech_batch(sample_texts, model, vectorizer)
+        for sample_text, (result, probability) in zip(sample_texts, predictions):
             print(
                 f"Prediction for '{sample_text}': {result} (Probability: {probability:.4f})"
             )
 
+        if "--benchmark" in sys.argv:
+            benchmark_batch_prediction(model, vectorizer, sample_texts)
+
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
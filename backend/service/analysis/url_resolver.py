@@ -0,0 +1,63 @@
+import asyncio, os, re
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional
+from service.cache import PersistentCache
+from service.http_client import http_client
+from service.config import CACHE_DIR, URL_CACHE_TTL, URL_RESOLVE_CONCURRENCY
+
+LOG = getLogger(__name__)
+
+T_CO_URL = re.compile(r"https?://t\.co/\w+")
+
+url_cache = PersistentCache(os.path.join(CACHE_DIR, "urls.sqlite"), ttl=URL_CACHE_TTL)
+
+
+async def resolve_url(url: str, slots: asyncio.Semaphore) -> Optional[str]:
+    """
+    Return where the shortened url points to, from a single HEAD request.
+    """
+    async with slots:
+        try:
+            async with http_client.request(
+                "HEAD", url, allow_redirects=False
+            ) as response:
+                return response.headers.get("Location")
+        except Exception as e:
+            LOG.debug(f"Failed to resolve {url}: {e}")
+            return None
+
+
+async def resolve_urls(urls: Iterable[str]) -> Dict[str, str]:
+    """
+    Resolve the given urls concurrently, reusing cached results.
+    Urls that failed to resolve are left out.
+    """
+    urls = set(urls)
+    if not urls:
+        return {}
+
+    resolved = await url_cache.aget_many(urls)
+    missing = [url for url in urls if url not in resolved]
+
+    slots = asyncio.Semaphore(URL_RESOLVE_CONCURRENCY)
+    targets = await asyncio.gather(*(resolve_url(url, slots) for url in missing))
+    new = {url: target for url, target in zip(missing, targets) if target}
+    await url_cache.aset_many(new)
+
+    resolved.update(new)
+    LOG.info(f"Resolved {len(urls)} urls, {len(urls) - len(missing)} from cache")
+    return resolved
+
+
+async def expand_tweet_urls(tweets: List[dict]) -> List[dict]:
+    """
+    Replace t.co links in the text of the tweets by the url they point to.
+    """
+    urls = {url for tweet in tweets for url in T_CO_URL.findall(tweet["text"])}
+    resolved = await resolve_urls(urls)
+
+    for tweet in tweets:
+        tweet["text"] = T_CO_URL.sub(
+            lambda match: resolved.get(match.group(0), match.group(0)), tweet["text"]
+        )
+    return tweets
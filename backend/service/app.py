@@ -1,21 +1,105 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, HTTPException, Request
 from fastapi.websockets import WebSocketDisconnect
 from . import processUserRequest
+from .browser_pool import default_browser_pool
+from .http_client import http_client
+from .executors import executors, loop_monitor, run_io
+from .credentials import twitter_accounts, instagram_sessions
+from .image_pipeline import image_pipeline
+from .analysis.url_resolver import url_cache
+from .analysis.llm_spam_detection import classification_cache
+from .analysis.triage import triage
+from .analysis import warm_up
+from .results import local_result, result_file, serve_file, tar_response
+from .config import ANALYSIS_WARM_UP, ADMIN_TOKEN
+from secrets import compare_digest
 from urllib.parse import unquote
-from fastapi.responses import FileResponse
 import json
 
 app = FastAPI()
 
 
+@app.on_event("startup")
+async def startup():
+    await loop_monitor.start()
+    await default_browser_pool.start()
+    await http_client.start()
+    if ANALYSIS_WARM_UP:
+        await run_io(warm_up)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await default_browser_pool.stop()
+    await http_client.stop()
+    await instagram_sessions.stop()
+    await loop_monitor.stop()
+    executors.shutdown()
+    image_pipeline.shutdown()
+
+
 @app.get("/")
 def read_root():
     return {"status": "ok"}
 
 
-@app.get("/file/{file_path}")
-async def read_file(file_path: str):
-    return FileResponse(unquote(file_path))
+@app.get("/metrics")
+def read_metrics():
+    return {
+        "browser_pool": default_browser_pool.stats(),
+        "http_client": http_client.stats(),
+        "url_cache": url_cache.stats(),
+        "classification_cache": classification_cache.stats(),
+        "triage": triage.stats(),
+        "twitter_accounts": twitter_accounts.stats(),
+        "instagram_sessions": instagram_sessions.stats(),
+        "image_pipeline": image_pipeline.stats(),
+        "executors": executors.stats(),
+        "event_loop": loop_monitor.stats(),
+    }
+
+
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def require_admin(request: Request):
+    if ADMIN_TOKEN:
+        token = request.headers.get("x-admin-token", "")
+        if not compare_digest(token, ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Forbidden")
+    elif not request.client or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.post("/model/reload")
+async def reload_model(request: Request, version: str = None):
+    """
+    Swap in a retrained hate speech model, the current version by default.
+    """
+    require_admin(request)
+    try:
+        manifest = await run_io(triage.registry.reload, version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to reload model: {e}")
+    return {"version": manifest["version"], "score": manifest["score"]}
+
+
+@app.api_route("/file/{file_path:path}", methods=["GET", "HEAD"])
+async def read_file(file_path: str, request: Request):
+    return await serve_file(request, local_result(unquote(file_path)))
+
+
+@app.api_route("/results/{task_id}/{file_path:path}", methods=["GET", "HEAD"])
+async def read_result(task_id: str, file_path: str, request: Request):
+    return await serve_file(request, result_file(task_id, file_path))
+
+
+@app.get("/archive/{task_id}.tar")
+async def download_results(task_id: str):
+    """
+    Stream all files of a result as a tar archive.
+    """
+    return tar_response(task_id)
 
 
 @app.websocket("/ws")
@@ -0,0 +1,455 @@
+import asyncio, inspect, os
+from collections import OrderedDict
+from time import monotonic, perf_counter
+from logging import getLogger
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from playwright.async_api import (
+    async_playwright,
+    Playwright,
+    Browser,
+    BrowserContext,
+    Cookie,
+)
+from browserforge.injectors.playwright import AsyncNewContext
+from browserforge.fingerprints import Fingerprint, FingerprintGenerator
+from service.executors import run_io, read_json
+from service.config import (
+    CHROME_PATH,
+    BROWSER_HEADLESS,
+    BROWSER_MAX_OPEN_CONTEXTS,
+    BROWSER_RECYCLE_AFTER,
+    BROWSER_MAX_MEMORY_MB,
+    CONTEXT_CACHE_SIZE,
+)
+
+LOG = getLogger(__name__)
+
+generator = FingerprintGenerator()
+
+# How often the memory usage of chromium is sampled, in seconds
+MEMORY_CHECK_INTERVAL = 10
+
+
+def _chromium_pids() -> Set[int]:
+    """
+    Chromium processes started by this process, empty without psutil.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return set()
+
+    pids = set()
+    for child in psutil.Process().children(recursive=True):
+        try:
+            if "chrom" in child.name().lower():
+                pids.add(child.pid)
+        except psutil.Error:
+            continue
+    return pids
+
+
+def _browser_root(pids: Set[int]) -> Optional[int]:
+    """
+    The process among the ones started by a launch whose parent is not one of them.
+    """
+    import psutil
+
+    for pid in pids:
+        try:
+            if psutil.Process(pid).ppid() not in pids:
+                return pid
+        except psutil.Error:
+            continue
+    return None
+
+
+class _PooledBrowser:
+    def __init__(self, browser: Browser, pid: int = None) -> None:
+        self.browser = browser
+        # Root chromium process, None when it could not be found
+        self.pid = pid
+        self.launched_at = monotonic()
+        self.contexts_created = 0
+        self.active: List[BrowserContext] = []
+        self.draining = False
+
+
+class BrowserPool:
+    """
+    Process-wide pool of chromium browsers handing out isolated contexts.
+
+    Connectors borrow a context with `new_context` and give it back with
+    `release` instead of closing the browser. The browser is recycled once it
+    has served `recycle_after` contexts or its processes use more
+    than `max_memory_mb`; the old browser is closed when its last context is
+    released.
+    """
+
+    def __init__(
+        self,
+        headless: bool = BROWSER_HEADLESS,
+        max_open_contexts: int = BROWSER_MAX_OPEN_CONTEXTS,
+        recycle_after: int = BROWSER_RECYCLE_AFTER,
+        max_memory_mb: int = BROWSER_MAX_MEMORY_MB,
+    ) -> None:
+        self.headless = headless
+        self.max_open_contexts = max_open_contexts
+        self.recycle_after = recycle_after
+        self.max_memory_mb = max_memory_mb
+
+        self._playwright: Playwright = None
+        self._current: _PooledBrowser = None
+        self._draining: List[_PooledBrowser] = []
+        self._owners: Dict[BrowserContext, _PooledBrowser] = {}
+        self._slots: asyncio.Semaphore = None
+        self._lock: asyncio.Lock = None
+        self._last_memory_check = 0
+        self._memory_mb = None
+
+        self.recycled = 0
+        self.contexts_created = 0
+
+        self.cache = ContextCache(self)
+
+    @property
+    def started(self) -> bool:
+        return self._playwright is not None
+
+    async def start(self):
+        if self.started:
+            return
+        self._slots = asyncio.Semaphore(self.max_open_contexts)
+        self._lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        self._current = await self._launch()
+        LOG.info("Browser pool started")
+
+    async def stop(self):
+        if not self.started:
+            return
+        self.cache.clear()
+        for pooled in self._draining + [self._current]:
+            if pooled:
+                await self._close(pooled)
+        self._draining = []
+        self._current = None
+        self._owners.clear()
+        await self._playwright.stop()
+        self._playwright = None
+        LOG.info("Browser pool stopped")
+
+    async def _launch(self) -> _PooledBrowser:
+        before = _chromium_pids()
+        browser = await self._playwright.chromium.launch(
+            headless=self.headless, executable_path=CHROME_PATH
+        )
+        return _PooledBrowser(browser, _browser_root(_chromium_pids() - before))
+
+    async def _close(self, pooled: _PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            LOG.error(f"Error closing browser: {e}")
+
+    def _chromium_memory_mb(self, pooled: _PooledBrowser) -> float:
+        """
+        Resident memory of the process tree of a browser, sampled at most
+        every MEMORY_CHECK_INTERVAL seconds. Returns None if psutil is not
+        available or the browser process is unknown.
+        """
+        if monotonic() - self._last_memory_check < MEMORY_CHECK_INTERVAL:
+            return self._memory_mb
+        self._last_memory_check = monotonic()
+
+        if pooled.pid is None:
+            return None
+        import psutil
+
+        try:
+            root = psutil.Process(pooled.pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        self._memory_mb = total / (1024 * 1024)
+        return self._memory_mb
+
+    def _should_recycle(self, pooled: _PooledBrowser) -> bool:
+        if not pooled.browser.is_connected():
+            return True
+        if self.recycle_after and pooled.contexts_created >= self.recycle_after:
+            return True
+        if self.max_memory_mb:
+            memory = self._chromium_memory_mb(pooled)
+            if memory is not None and memory > self.max_memory_mb:
+                LOG.warning(f"Chromium is using {memory:.0f}MB, recycling browser")
+                return True
+        return False
+
+    async def _get_browser(self) -> _PooledBrowser:
+        recycled = False
+        async with self._lock:
+            if self._should_recycle(self._current):
+                recycled = True
+                old = self._current
+                old.draining = True
+                self._current = await self._launch()
+                self.recycled += 1
+                # The reading was of the old browser. Waiting a whole interval
+                # before measuring the new one allows one recycle per interval
+                self._memory_mb = None
+                self._last_memory_check = monotonic()
+                if old.active and old.browser.is_connected():
+                    self._draining.append(old)
+                else:
+                    await self._close(old)
+            current = self._current
+        if recycled:
+            # Idle cached contexts would otherwise keep the old browser open
+            await self.cache.retire_stale()
+        return current
+
+    async def new_context(self, fingerprint: Fingerprint = None, **kwargs) -> BrowserContext:
+        """
+        Borrow a new isolated context, waiting for a free slot if the pool is full.
+        Every context must be handed back with `release`.
+        """
+        if not self.started:
+            await self.start()
+
+        await self._slots.acquire()
+        try:
+            pooled = await self._get_browser()
+            if fingerprint:
+                context = await AsyncNewContext(
+                    pooled.browser, fingerprint=fingerprint, **kwargs
+                )
+            else:
+                context = await pooled.browser.new_context(**kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        pooled.contexts_created += 1
+        pooled.active.append(context)
+        self._owners[context] = pooled
+        self.contexts_created += 1
+        return context
+
+    async def release(self, context: BrowserContext):
+        """
+        Close a context borrowed from the pool and free its slot.
+        """
+        pooled = self._owners.pop(context, None)
+        if pooled is None:
+            return
+
+        try:
+            await context.close()
+        except Exception as e:
+            LOG.error(f"Error closing context: {e}")
+        finally:
+            pooled.active.remove(context)
+            self._slots.release()
+
+        # The last contexts of a draining browser can be released concurrently,
+        # only the first release to get here closes it
+        if pooled.draining and not pooled.active and pooled in self._draining:
+            self._draining.remove(pooled)
+            await self._close(pooled)
+
+    @asynccontextmanager
+    async def context(self, fingerprint: Fingerprint = None, **kwargs):
+        context = await self.new_context(fingerprint=fingerprint, **kwargs)
+        try:
+            yield context
+        finally:
+            await self.release(context)
+
+    def is_stale(self, context: BrowserContext) -> bool:
+        """
+        Whether the context belongs to a browser that is being recycled.
+        """
+        pooled = self._owners.get(context)
+        return pooled is None or pooled.draining
+
+    def stats(self) -> dict:
+        active = sum(len(pooled.active) for pooled in self._draining)
+        if self._current:
+            active += len(self._current.active)
+        return {
+            "started": self.started,
+            "active_contexts": active,
+            "max_open_contexts": self.max_open_contexts,
+            "occupancy": active / self.max_open_contexts,
+            "browsers": len(self._draining) + (1 if self._current else 0),
+            "draining_browsers": len(self._draining),
+            "current_browser_contexts": (
+                self._current.contexts_created if self._current else 0
+            ),
+            "contexts_created": self.contexts_created,
+            "recycled": self.recycled,
+            "chromium_memory_mb": self._memory_mb,
+            "context_cache": self.cache.stats(),
+        }
+
+
+class _CachedContext:
+    def __init__(self, context: BrowserContext) -> None:
+        self.context = context
+        self.leases = 0
+
+
+class ContextCache:
+    """
+    Size-limited LRU cache of pooled contexts keyed by (service, device, account).
+
+    A cached context keeps its fingerprint and the cookies loaded into it, so
+    repeated captures for the same platform skip both. Contexts are only
+    evicted while nobody is using them.
+    """
+
+    def __init__(self, pool: BrowserPool, max_size: int = CONTEXT_CACHE_SIZE) -> None:
+        self.pool = pool
+        self.max_size = max_size
+
+        self._entries: "OrderedDict[Tuple, _CachedContext]" = OrderedDict()
+        self._retired: List[_CachedContext] = []
+        self._fingerprints: Dict[Tuple, Fingerprint] = {}
+        self._cookies: Dict[str, Tuple[float, list]] = {}
+        self._locks: Dict[Tuple, asyncio.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.total_wait_ms = 0.0
+
+    def fingerprint(self, key: Tuple, device: str) -> Fingerprint:
+        if device != "mobile":
+            return None
+        if key not in self._fingerprints:
+            self._fingerprints[key] = generator.generate(device=("mobile",))
+        return self._fingerprints[key]
+
+    async def load_cookies(self, path: str) -> list:
+        """
+        Read a cookie file, reusing the parsed content until the file changes.
+        """
+        mtime = await run_io(os.path.getmtime, path)
+        cached = self._cookies.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        cookies = await read_json(path)
+        self._cookies[path] = (mtime, cookies)
+        return cookies
+
+    async def retire_stale(self):
+        """
+        Retire the cached contexts of recycled browsers, closing idle ones now
+        and the others once their last lease ends.
+        """
+        for key, entry in list(self._entries.items()):
+            if self.pool.is_stale(entry.context):
+                del self._entries[key]
+                self._retired.append(entry)
+        await self._evict()
+
+    async def _acquire(
+        self, key: Tuple, device: str, cookies: Union[List[Cookie], Callable]
+    ) -> Tuple[_CachedContext, bool]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and self.pool.is_stale(entry.context):
+                del self._entries[key]
+                self._retired.append(entry)
+                entry = None
+
+            hit = entry is not None
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                context = await self.pool.new_context(
+                    fingerprint=self.fingerprint(key, device)
+                )
+                if callable(cookies):
+                    cookies = cookies()
+                    if inspect.isawaitable(cookies):
+                        cookies = await cookies
+                if cookies:
+                    await context.add_cookies(cookies)
+                entry = _CachedContext(context)
+                self._entries[key] = entry
+                self.misses += 1
+
+            entry.leases += 1
+        return entry, hit
+
+    async def _evict(self):
+        for entry in list(self._retired):
+            if not entry.leases:
+                self._retired.remove(entry)
+                await self.pool.release(entry.context)
+
+        while len(self._entries) > self.max_size:
+            idle = next((k for k, e in self._entries.items() if not e.leases), None)
+            if idle is None:
+                break
+            entry = self._entries.pop(idle)
+            await self.pool.release(entry.context)
+
+    @asynccontextmanager
+    async def lease(
+        self,
+        service: str,
+        device: str,
+        account: str = None,
+        cookies: Union[List[Cookie], Callable] = None,
+    ):
+        """
+        Borrow the cached context for (service, device, account), creating it
+        if needed. `cookies` may be a callable, or coroutine function, so they
+        are only built on a miss.
+        """
+        key = (service, device, account)
+        started_at = perf_counter()
+        entry, hit = await self._acquire(key, device, cookies)
+        elapsed = (perf_counter() - started_at) * 1000
+        self.total_wait_ms += elapsed
+        LOG.info(
+            f"Context for {service}/{device} ready in {elapsed:.1f}ms"
+            f" ({'cached' if hit else 'created'})"
+        )
+
+        try:
+            yield entry.context
+        finally:
+            entry.leases -= 1
+            await self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._retired.clear()
+
+    def stats(self) -> dict:
+        leases = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "avg_wait_ms": self.total_wait_ms / leases if leases else 0.0,
+        }
+
+
+# Named apart from the module, so importing it never shadows service.browser_pool
+default_browser_pool = BrowserPool()
@@ -0,0 +1,104 @@
+import json, os, sqlite3, threading
+from time import time
+from logging import getLogger
+from typing import Dict, Iterable
+from service.executors import run_io
+
+LOG = getLogger(__name__)
+
+# SQLite limits the number of bound parameters of a single query
+BATCH_SIZE = 500
+
+
+class PersistentCache:
+    """
+    SQLite backed key-value cache of JSON values.
+
+    Entries expire `ttl` seconds after being written. When `max_entries` is
+    set, the least recently used entries are evicted beyond that size.
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_entries: int = None) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._db: sqlite3.Connection = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+            )
+        return self._db
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time()
+        with self._lock:
+            db = self._connect()
+            for i in range(0, len(keys), BATCH_SIZE):
+                batch = keys[i : i + BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                query = f"SELECT key, value FROM cache WHERE key IN ({placeholders})"
+                params = list(batch)
+                if self.ttl:
+                    query += " AND created > ?"
+                    params.append(now - self.ttl)
+                for key, value in db.execute(query, params):
+                    found[key] = json.loads(value)
+
+                db.execute(
+                    f"UPDATE cache SET accessed = ? WHERE key IN ({placeholders})",
+                    [now, *batch],
+                )
+            db.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[str, object]):
+        if not items:
+            return
+        now = time()
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed)"
+                " VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value), now, now) for key, value in items.items()],
+            )
+            if self.max_entries:
+                db.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache"
+                    " ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            db.commit()
+
+    async def aget_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        return await run_io(self.get_many, list(keys))
+
+    async def aset_many(self, items: Dict[str, object]):
+        await run_io(self.set_many, items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,6 +1,6 @@
 import os
 import json
-from decouple import config
+from decouple import config, Csv
 
 CHROME_PATH = config(
     "CHROME_PATH", default="C:\Program Files\Google\Chrome\Application\chrome.exe"
@@ -9,6 +9,10 @@ TWITTER_USERNAME = config("TWITTER_USERNAME", default="")
 TWITTER_PASSWORD = config("TWITTER_PASSWORD", default="")
 
 TWITTER_ACCOUNTS_PATH = config("TWITTER_ACCOUNTS_PATH", default="")
+# Concurrent browser sessions allowed on a single account
+TWITTER_SESSIONS_PER_ACCOUNT = config("TWITTER_SESSIONS_PER_ACCOUNT", default=2, cast=int)
+# Seconds to wait for an account to become available
+TWITTER_LEASE_TIMEOUT = config("TWITTER_LEASE_TIMEOUT", default=60, cast=float)
 
 INSTAGRAM_SESSIONS_PATH = config(
     "INSTAGRAM_SESSIONS_PATH", default=""
@@ -18,11 +22,84 @@ INSTAGRAM_PASSWORD = config("INSTAGRAM_PASSWORD", default="")
 INSTAGRAM_COOKIES_PATH = config(
     "INSTAGRAM_COOKIES_PATH", default=""
 )
+# Additional accounts for the API session pool, as "username:password,..."
+INSTAGRAM_ACCOUNTS = config("INSTAGRAM_ACCOUNTS", default="", cast=Csv())
+# Seconds between checks that idle sessions are still logged in
+INSTAGRAM_SESSION_REFRESH = config(
+    "INSTAGRAM_SESSION_REFRESH", default=30 * 60, cast=float
+)
 
 GROQ_TOKEN = config("GROQ_TOKEN", default="GROQ_TOKEN")
 GROQ_MODEL = config("GROQ_MODEL", default="llama-3.1-8b-instant")
+LLM_CONCURRENCY = config("LLM_CONCURRENCY", default=4, cast=int)
+LLM_MAX_RETRIES = config("LLM_MAX_RETRIES", default=3, cast=int)
+LLM_CONTEXT_TOKENS = config("LLM_CONTEXT_TOKENS", default=8192, cast=int)
+LLM_MAX_OUTPUT_TOKENS = config("LLM_MAX_OUTPUT_TOKENS", default=4096, cast=int)
 PORT = config("PORT", default=8000)
 RESULT_DATA_DIR = config("RESULT_DATA_DIR", default="results")
+# Required in the X-Admin-Token header of admin endpoints. When empty, they
+# only accept requests from localhost.
+ADMIN_TOKEN = config("ADMIN_TOKEN", default="")
+
+# Connector scheduling
+MAX_CONCURRENT_CONNECTORS = config("MAX_CONCURRENT_CONNECTORS", default=8, cast=int)
+MAX_CONNECTORS_PER_REQUEST = config("MAX_CONNECTORS_PER_REQUEST", default=4, cast=int)
+CONNECTOR_TIMEOUT = config("CONNECTOR_TIMEOUT", default=300, cast=float)
+# Post tasks run the bulk analysis and build the reports, which takes longer
+# for large accounts. 0 runs them without a timeout.
+POST_TASK_TIMEOUT = config("POST_TASK_TIMEOUT", default=0, cast=float)
+
+# Browser pool
+BROWSER_HEADLESS = config("BROWSER_HEADLESS", default=True, cast=bool)
+BROWSER_MAX_OPEN_CONTEXTS = config("BROWSER_MAX_OPEN_CONTEXTS", default=16, cast=int)
+BROWSER_RECYCLE_AFTER = config("BROWSER_RECYCLE_AFTER", default=200, cast=int)
+BROWSER_MAX_MEMORY_MB = config("BROWSER_MAX_MEMORY_MB", default=2048, cast=int)
+CONTEXT_CACHE_SIZE = config("CONTEXT_CACHE_SIZE", default=8, cast=int)
+
+# Shared HTTP client
+HTTP_MAX_CONNECTIONS = config("HTTP_MAX_CONNECTIONS", default=100, cast=int)
+HTTP_MAX_PER_HOST = config("HTTP_MAX_PER_HOST", default=10, cast=int)
+HTTP_DNS_CACHE_TTL = config("HTTP_DNS_CACHE_TTL", default=300, cast=int)
+HTTP_KEEPALIVE_TIMEOUT = config("HTTP_KEEPALIVE_TIMEOUT", default=30, cast=float)
+HTTP_TIMEOUT = config("HTTP_TIMEOUT", default=30, cast=float)
+
+CACHE_DIR = config("CACHE_DIR", default="cache")
+
+# Thumbnails and display versions of screenshots
+IMAGE_PIPELINE_WORKERS = config("IMAGE_PIPELINE_WORKERS", default=2, cast=int)
+IMAGE_THUMBNAIL_WIDTH = config("IMAGE_THUMBNAIL_WIDTH", default=320, cast=int)
+IMAGE_DISPLAY_WIDTH = config("IMAGE_DISPLAY_WIDTH", default=1280, cast=int)
+IMAGE_FORMAT = config("IMAGE_FORMAT", default="webp")
+IMAGE_QUALITY = config("IMAGE_QUALITY", default=75, cast=int)
+
+# Thread pools for blocking calls
+NETWORK_EXECUTOR_WORKERS = config("NETWORK_EXECUTOR_WORKERS", default=16, cast=int)
+IO_EXECUTOR_WORKERS = config("IO_EXECUTOR_WORKERS", default=4, cast=int)
+# Event loop stalls longer than this many seconds are logged
+LOOP_LAG_THRESHOLD = config("LOOP_LAG_THRESHOLD", default=0.1, cast=float)
+LOOP_LAG_INTERVAL = config("LOOP_LAG_INTERVAL", default=0.05, cast=float)
+
+# t.co expansion
+URL_CACHE_TTL = config("URL_CACHE_TTL", default=7 * 24 * 3600, cast=int)
+URL_RESOLVE_CONCURRENCY = config("URL_RESOLVE_CONCURRENCY", default=20, cast=int)
+
+# Local hate speech model used to triage tweets before the LLM
+NLTK_DATA_DIR = config("NLTK_DATA_DIR", default="nltk_data")
+ANALYSIS_WARM_UP = config("ANALYSIS_WARM_UP", default=True, cast=bool)
+HATE_SPEECH_MODEL_DIR = config("HATE_SPEECH_MODEL_DIR", default="models")
+# Opt-in: the local model only assesses hate speech, so cleared tweets get no
+# score for the other categories
+TRIAGE_ENABLED = config("TRIAGE_ENABLED", default=False, cast=bool)
+# Tweets scored below this probability are not sent to the LLM
+TRIAGE_THRESHOLD = config("TRIAGE_THRESHOLD", default=0.2, cast=float)
+DATASET_CACHE_DIR = config(
+    "DATASET_CACHE_DIR", default=os.path.join(CACHE_DIR, "datasets")
+)
+
+# Per-tweet LLM classification cache
+CLASSIFICATION_CACHE_SIZE = config(
+    "CLASSIFICATION_CACHE_SIZE", default=100000, cast=int
+)
 
 
 def read_config():
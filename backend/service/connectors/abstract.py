@@ -1,22 +1,49 @@
 import os, asyncio
 from abc import ABC, abstractmethod
-from typing import Union, Dict, List
+from typing import Awaitable, Callable, Union, Dict, List
 from logging import Logger
 from os.path import splitext
+from time import monotonic
 from playwright.async_api import (
     async_playwright,
     Playwright,
     Browser,
+    Error,
     TimeoutError,
     Page,
 )
-from browserforge.injectors.playwright import AsyncNewContext
 from service.config import get_config
-from browserforge.fingerprints.generator import FingerprintGenerator
+from service.browser_pool import BrowserPool, generator
 from fastapi import WebSocket
-from aiohttp import ClientSession
+from service.http_client import http_client
+from service.executors import run_io, write_bytes
+from service.image_pipeline import image_pipeline
+from service.images import (
+    EXTENSIONS,
+    NATIVE_FORMATS,
+    FrameDeduplicator,
+    encode,
+    resolve_format,
+)
 
-generator = FingerprintGenerator()
+# Resolves once the DOM has not changed for `quiet` ms, or after `limit` ms
+SETTLE_SCRIPT = """
+([quiet, limit]) => new Promise((resolve) => {
+    const done = () => {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(deadline);
+        resolve();
+    };
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(done, quiet);
+    });
+    let timer = setTimeout(done, quiet);
+    const deadline = setTimeout(done, limit);
+    observer.observe(document, { childList: true, subtree: true, attributes: true });
+})
+"""
 
 
 class Connector(ABC):
@@ -29,6 +56,10 @@ class Connector(ABC):
         self.last_active_timestamp = None
         self.websocket = websocket
         self.username = username
+        self._signals: Dict[str, asyncio.Event] = {}
+        self._image_jobs: List[asyncio.Future] = []
+        self._previews: Dict[str, dict] = {}
+        self._stitched: Dict[str, str] = {}
 
     @abstractmethod
     async def get_api_data(self):
@@ -45,9 +76,74 @@ class Connector(ABC):
             await self.websocket.send_json({"service": self.service, "data": data})
         return
 
+    def process_images(self, images: List[str], stitch_as: str = None):
+        """
+        Make previews of the screenshots in the background, sending them over
+        the websocket once ready. With `stitch_as`, the images are also
+        stitched into a single one of that name.
+        """
+        if images and image_pipeline.enabled:
+            self._image_jobs.append(
+                asyncio.ensure_future(self._process_images(images, stitch_as))
+            )
+
+    async def _process_images(self, images: List[str], stitch_as: str = None):
+        variants = await image_pipeline.process(images)
+        self._previews.update(
+            {
+                original: {
+                    "thumbnail": variant["thumbnail"],
+                    "display": variant["display"],
+                }
+                for original, variant in variants.items()
+            }
+        )
+        await self.send_data({"key": "previews", "data": self._previews})
+
+        if stitch_as:
+            stitched = await image_pipeline.stitch(images, stitch_as)
+            if stitched:
+                self._stitched[stitch_as] = stitched
+                await self.send_data({"key": "stitched", "data": self._stitched})
+
+    async def wait_for_images(self):
+        """
+        Wait for the previews of all screenshots taken so far.
+        """
+        while self._image_jobs:
+            jobs, self._image_jobs = self._image_jobs, []
+            for result in await asyncio.gather(*jobs, return_exceptions=True):
+                if isinstance(result, Exception):
+                    self.logger.error(f"Failed to process images: {result}")
+
+    def _get_signal(self, key: str) -> asyncio.Event:
+        if key not in self._signals:
+            self._signals[key] = asyncio.Event()
+        return self._signals[key]
+
+    def set_signal(self, key: str):
+        """
+        Mark the payload `key` as captured, waking up everyone waiting on it.
+        """
+        self._get_signal(key).set()
+
+    async def wait_for_signal(self, key: str, timeout: float = None) -> bool:
+        """
+        Wait until `set_signal(key)` is called. Returns False if `timeout`
+        seconds (api_wait_timeout by default) pass first.
+        """
+        if timeout is None:
+            timeout = get_config("api_wait_timeout", 20)
+        try:
+            await asyncio.wait_for(self._get_signal(key).wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Timed out after {timeout}s waiting for {key}")
+            return False
+
     async def capture_page(
         self,
-        browser: Browser,
+        pool: BrowserPool,
         page_url: Union[str, Dict[str, str]] = None,
         screenshot_path: str = None,
         device_targets: List[str] = None,
@@ -57,80 +153,129 @@ class Connector(ABC):
         if not device_targets:
             device_targets = get_config("device_targets", ["desktop", "android"])
 
-        images = []
-
-        cl = fn or self.__capture_page
+        mobile_targets = []
         if "desktop" in device_targets:
-            images.extend(await cl(browser, page_url, screenshot_path, handler=handler))
-
+            mobile_targets.append(False)
         if "android" in device_targets:
-            images.extend(
-                await cl(
-                    browser, page_url, screenshot_path, mobile=True, handler=handler
-                )
-            )
+            mobile_targets.append(True)
 
+        if fn:
+            jobs = [
+                fn(pool, page_url, screenshot_path, mobile=mobile, handler=handler)
+                for mobile in mobile_targets
+            ]
+        else:
+            if isinstance(page_url, str):
+                page_url = {page_url: screenshot_path}
+
+            slots = asyncio.Semaphore(self.capture_concurrency)
+            jobs = [
+                self.__capture_page(pool, url, path, slots, mobile, handler)
+                for mobile in mobile_targets
+                for url, path in page_url.items()
+            ]
+
+        # gather keeps the order of the jobs: desktop first, then urls in order
+        results = await asyncio.gather(*jobs)
+        images = [image for images in results for image in images]
+        self.process_images(images)
         return images
 
     @property
     def full_page(self):
         return get_config("capture_full_page", False)
 
+    @property
+    def capture_concurrency(self) -> int:
+        return get_config("capture_concurrency", 4)
+
+    @property
+    def capture_timeout(self) -> float:
+        return get_config("capture_timeout", 15)
+
+    @property
+    def capture_wait_mode(self) -> str:
+        return get_config("capture_wait_mode", "settled")
+
+    @property
+    def capture_format(self) -> str:
+        return get_config("capture_format", "png")
+
+    @property
+    def capture_quality(self) -> int:
+        return get_config("capture_quality", 80)
+
+    @property
+    def capture_dedupe(self) -> str:
+        return get_config("capture_dedupe", "bytes")
+
+    async def wait_for_render(self, page: Page, quiet_ms: int = 500, timeout_ms: int = 5000):
+        """
+        Wait until the DOM has stopped changing for `quiet_ms`, or `timeout_ms` passed.
+        """
+        try:
+            await page.evaluate(SETTLE_SCRIPT, [quiet_ms, timeout_ms])
+        except Error as e:
+            self.logger.debug(f"Failed waiting for render: {e}")
+
+    async def load_page(self, page: Page, url: str, timeout: float):
+        """
+        Navigate to the url, waiting at most `timeout` seconds for it to load.
+        """
+        deadline = monotonic() + timeout
+        if self.capture_wait_mode == "networkidle":
+            await page.goto(
+                url, wait_until="networkidle", timeout=min(timeout, 10) * 1000
+            )
+            return
+
+        await page.goto(url, wait_until="load", timeout=timeout * 1000)
+        remaining = deadline - monotonic()
+        if remaining > 0:
+            await self.wait_for_render(page, timeout_ms=int(remaining * 1000))
+
     async def __capture_page(
         self,
-        browser: Browser,
-        page_url: str,
-        screenshot_path: str = None,
+        pool: BrowserPool,
+        url: str,
+        path: str,
+        slots: asyncio.Semaphore,
         mobile: bool = False,
         handler=None,
     ):
         """
         Capture a screenshot of the page and return the path to the screenshot.
         """
-        full_page = self.full_page
-
-        if mobile:
-            context = await AsyncNewContext(
-                browser, fingerprint=generator.generate(device=("mobile",))
-            )
-            page = await context.new_page()
-        else:
-            page = await browser.new_page()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
 
-        outputs = []
-        if isinstance(page_url, str):
-            page_url = {page_url: screenshot_path}
-
-        for url, path in page_url.items():
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-
-            screen_path, extension = splitext(path)
-            actual_path = (
-                screen_path + "_" + ("mobile" if mobile else "desktop") + extension
-            )
-            if handler:
-                await handler(page)
+        device = "mobile" if mobile else "desktop"
+        screen_path, extension = splitext(path)
+        actual_path = screen_path + "_" + device + extension
 
+        async with slots, pool.cache.lease(self.service, device) as context:
+            page = await context.new_page()
             try:
-                await page.goto(url, wait_until="networkidle", timeout=10000)
-            except TimeoutError:
-                pass
-            await page.screenshot(path=actual_path, full_page=full_page)
-            outputs.append(os.path.abspath(actual_path))
-
-        await page.close()
-        return outputs
+                if handler:
+                    await handler(page)
+
+                try:
+                    await self.load_page(page, url, self.capture_timeout)
+                except TimeoutError:
+                    self.logger.info(f"{url} did not load in time, capturing anyway")
+                await page.screenshot(path=actual_path, full_page=self.full_page)
+            except Error as e:
+                self.logger.error(f"Error capturing {url}: {e}")
+                return []
+            finally:
+                await page.close()
+
+        return [os.path.abspath(actual_path)]
 
     async def download_image(self, image_url: str, output_path: str):
         """
         Download an image from the given URL and return the path to the image.
         """
-        async with ClientSession() as session:
-            async with session.get(image_url) as response:
-                with open(output_path, "wb") as f:
-                    f.write(await response.read())
-
-        return output_path
+        return await http_client.download(image_url, output_path)
 
     async def get_page_height(self, page: Page) -> int:
         """
@@ -154,35 +299,67 @@ class Connector(ABC):
         pass
 
     async def capture_bulk_page(
-        self, page: Page, max_screenshots: int, path: str, message: str
+        self,
+        page: Page,
+        max_screenshots: int,
+        path: str,
+        message: str,
+        on_image: Callable[[str], Awaitable] = None,
     ):
         """
-        Capture a screenshot of the page at the given y coordinate.
+        Capture the page one viewport at a time while scrolling down, skipping
+        frames that repeat an earlier one. Skipped frames count towards
+        `max_screenshots`, so a page that keeps repeating itself still ends.
+        `on_image` is awaited with the path of each screenshot as soon as it
+        is written.
         """
         os.makedirs(path, exist_ok=True)
 
         await self.send_data({"key": "message", "data": message})
 
+        fmt = resolve_format(self.capture_format)
+        quality = self.capture_quality
+        frames = FrameDeduplicator(self.capture_dedupe)
+
         maxHeight = await self.get_page_height(page)
         clientHeight = await self.get_client_height(page)
         screenshots = []
 
-        for i in range(0, maxHeight, clientHeight):
-            if len(screenshots) >= max_screenshots:
-                break
-
+        i = 0
+        captured = 0
+        # The page grows as it loads more content, so its height is read again
+        while i < maxHeight and captured < max_screenshots:
             self.logger.info(f"Capturing screenshot at {i}")
 
             await self.scroll_to(page, i)
+            # move on as soon as the newly scrolled content has rendered
+            await self.wait_for_render(page, quiet_ms=150, timeout_ms=1000)
+
+            if fmt in NATIVE_FORMATS:
+                options = {"quality": quality} if fmt == "jpeg" else {}
+                data = await page.screenshot(type=fmt, **options)
+            else:
+                data = await page.screenshot(type="png")
+            captured += 1
+
+            if not await run_io(frames.is_duplicate, data):
+                if fmt not in NATIVE_FORMATS:
+                    data = await run_io(encode, data, fmt, quality)
+                ssPath = os.path.abspath(os.path.join(path, f"screen-{i}{EXTENSIONS[fmt]}"))
+                await write_bytes(ssPath, data)
+                screenshots.append(ssPath)
+                if on_image:
+                    await on_image(ssPath)
+
+            i += clientHeight
             maxHeight = await self.get_page_height(page)
-            ssPath = os.path.join(path, f"screen-{i}.png")
-
-            await page.wait_for_load_state("domcontentloaded")
-            await page.screenshot(path=ssPath)
-
-            screenshots.append(os.path.abspath(ssPath))
-            await asyncio.sleep(0.5)
 
+        if frames.dropped:
+            self.logger.info(f"Dropped {frames.dropped} duplicate screenshots")
+        stitch = get_config("capture_stitch", False)
+        self.process_images(
+            screenshots, stitch_as=os.path.basename(path) if stitch else None
+        )
         await self.send_data({"key": "message", "data": ""})
 
         return screenshots
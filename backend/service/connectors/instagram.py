@@ -5,7 +5,10 @@ from instagrapi.types import User
 from pydantic.networks import HttpUrl
 from os.path import splitext
 from service.connectors.abstract import Connector, generator
-from browserforge.injectors.playwright import AsyncNewContext
+from service.browser_pool import BrowserPool
+from service.executors import run_io, read_json, write_json
+from service.storage import RecordStore
+from service.credentials import instagram_sessions
 from service.config import (
     INSTAGRAM_SESSIONS_PATH,
     INSTAGRAM_USERNAME,
@@ -25,6 +28,9 @@ from playwright.async_api import (
 from logging import getLogger
 from fastapi import WebSocket
 
+# Users fetched per request when exporting followers or following
+USERS_PAGE_SIZE = 200
+
 
 class Instagram(Connector):
     service = "instagram"
@@ -32,65 +38,87 @@ class Instagram(Connector):
 
     def __init__(self, username: str, websocket: WebSocket) -> None:
         super().__init__(username, websocket)
-        self._client = None
         self._path = None
         self.processed_api = False
 
-    @property
-    def client(self):
-        if self._client is None:
-            self._client = Client()
-            path = os.path.join(INSTAGRAM_SESSIONS_PATH, f"{INSTAGRAM_USERNAME}.json")
-            if os.path.exists(path):
-                self._client.load_settings(path)
-            else:
-                self._client.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-
-                self._client.dump_settings(path)
-
-        return self._client
+    async def iter_users(
+        self,
+        method: Callable,
+        user_id: str,
+        cursor: str = "",
+        page_size: int = USERS_PAGE_SIZE,
+    ):
+        """
+        Walk a follower or following list page by page, starting at `cursor`.
+        Yields each page of users with the cursor of the next page, which is
+        empty after the last one.
+        """
+        while True:
+            users, cursor = await instagram_sessions.run(
+                method, user_id, page_size, cursor or ""
+            )
+            yield users, cursor
+            if not cursor:
+                break
+
+    async def export_users(self, kind: str, method: Callable, user_id: str, path: str):
+        """
+        Stream a follower or following list into a RecordStore, resuming from
+        the cursor saved by an interrupted export.
+        """
+        store = RecordStore(os.path.join(path, "records", kind))
+        cursor_path = os.path.join(store.path, "cursor.json")
+
+        cursor = ""
+        if os.path.exists(cursor_path):
+            cursor = (await read_json(cursor_path)).get("cursor", "")
+            if cursor:
+                self.logger.info(f"Resuming {kind} export of {self.username}")
+
+        count = await run_io(len, store)
+        async for users, cursor in self.iter_users(method, user_id, cursor):
+            count += await store.append(
+                {str(user.pk): user.model_dump(mode="json") for user in users}
+            )
+            await write_json(cursor_path, {"cursor": cursor, "count": count})
+            await self.send_data(
+                {"key": f"{kind}_export", "data": {"count": count, "done": not cursor}}
+            )
+        return store
 
-    async def get_followers(self, user_id: str, path: str, browser: Browser):
+    async def get_followers(self, user_id: str, path: str, pool: BrowserPool):
         self.logger.info(f"Getting followers for {self.username}")
 
+        await self.export_users(
+            "followers", Client.user_followers_v1_chunk, user_id, path
+        )
+
         path = os.path.join(path, "followers")
         os.makedirs(path, exist_ok=True)
 
-        followers = self.client.user_followers(user_id)
-        data = [
-            json.loads(follower.model_dump_json()) for follower in followers.values()
-        ]
-
-        with open(os.path.join(path, "followers.json"), "w") as f:
-            json.dump(data, f)
-
         images = await self.capture_page(
-            browser=browser,
+            pool=pool,
             fn=self.capture_page_view,
             screenshot_path=os.path.join(path, "capture.png"),
             page_url=f"https://www.instagram.com/{self.username}/followers/",
         )
         await self.send_data({"key": "followers_capture", "data": images})
 
-    async def get_following(self, user_id: str, path: str, browser: Browser):
+    async def get_following(self, user_id: str, path: str, pool: BrowserPool):
         self.logger.info(f"Getting following for {self.username}")
-        path = os.path.join(path, "following")
-        os.makedirs(path, exist_ok=True)
 
-        following = self.client.user_following(user_id)
-        data = [
-            json.loads(following.model_dump_json()) for following in following.values()
-        ]
+        await self.export_users(
+            "following", Client.user_following_v1_chunk, user_id, path
+        )
 
-        with open(os.path.join(path, "following.json"), "w") as f:
-            json.dump(data, f)
+        path = os.path.join(path, "following")
+        os.makedirs(path, exist_ok=True)
 
         pageUrl = f"https://www.instagram.com/{self.username}/following/"
         self.logger.info(f"Capturing page view for {pageUrl}")
 
         images = await self.capture_page(
-            browser=browser,
+            pool=pool,
             page_url=pageUrl,
             fn=self.capture_page_view,
             screenshot_path=os.path.join(path, "capture.png"),
@@ -98,14 +126,14 @@ class Instagram(Connector):
         await self.send_data({"key": "following_capture", "data": images})
 
     async def get_api_data(self, username: str):
-        info = self.client.user_info_by_username(username)
+        info = await instagram_sessions.run(Client.user_info_by_username, username)
         return info.model_dump_json()
 
     async def process_data(
         self,
         output_path: str,
         store_api_responses: bool = True,
-        browser: Browser = None,
+        pool: BrowserPool = None,
         in_depth: bool = False,
     ):
         path = os.path.join(output_path, f"{self.service}/{self.username}")
@@ -118,13 +146,15 @@ class Instagram(Connector):
         #            with open(os.path.join(path, "api_data.json"), "w") as f:
         #                f.write(info)
 
-        #        user_id = self.client.user_id_from_username(self.username)
+        #        user_id = await instagram_sessions.run(
+        #            Client.user_id_from_username, self.username
+        #        )
 
-        #        await self.get_followers(user_id, path, browser)
-        #        await self.get_following(user_id, path, browser)
+        #        await self.get_followers(user_id, path, pool)
+        #        await self.get_following(user_id, path, pool)
         await self.send_data({"key": "message", "data": "Capturing screenshots."})
         images = await self.capture_page(
-            browser=browser,
+            pool=pool,
             fn=self.capture_page_view,
             screenshot_path=os.path.join(path, "capture.png"),
         )
@@ -142,8 +172,7 @@ class Instagram(Connector):
                 try:
                     user = responseData["data"]["user"]
                     if path:
-                        with open(os.path.join(path, "api_data.json"), "w") as f:
-                            json.dump(user, f)
+                        await write_json(os.path.join(path, "api_data.json"), user)
 
                     parsedUser = {
                         "name": user["full_name"],
@@ -196,46 +225,58 @@ class Instagram(Connector):
 
     async def capture_page_view(
         self,
-        browser: Browser,
+        pool: BrowserPool,
         page_url: str = None,
         screenshot_path: str = None,
         mobile: bool = False,
         handler: Callable = None,
     ):
 
-        with open(INSTAGRAM_COOKIES_PATH, "r") as f:
-            cookies = json.load(f)
-
-        if mobile:
-            context = await AsyncNewContext(
-                browser, fingerprint=generator.generate(device=("mobile",))
-            )
-        else:
-            context = await browser.new_context()
-        page = await context.new_page()
-        for cookie in cookies:
-            await context.add_cookies(
-                [
-                    Cookie(
-                        name=cookie["name"],
-                        value=cookie["value"],
-                        domain=cookie["domain"],
-                        path=cookie["path"],
-                        expires=-1,
-                        httpOnly=cookie["httpOnly"],
-                        secure=cookie["secure"],
-                    )
-                ]
+        device = "mobile" if mobile else "desktop"
+        async with pool.cache.lease(
+            self.service,
+            device,
+            account=INSTAGRAM_USERNAME,
+            cookies=lambda: self.get_browser_cookies(pool),
+        ) as context:
+            page = await context.new_page()
+            try:
+                return await self._capture_page_view(
+                    page, screenshot_path, mobile, handler
+                )
+            finally:
+                await page.close()
+
+    async def get_browser_cookies(self, pool: BrowserPool):
+        cookies = await pool.cache.load_cookies(INSTAGRAM_COOKIES_PATH)
+        return [
+            Cookie(
+                name=cookie["name"],
+                value=cookie["value"],
+                domain=cookie["domain"],
+                path=cookie["path"],
+                expires=-1,
+                httpOnly=cookie["httpOnly"],
+                secure=cookie["secure"],
             )
+            for cookie in cookies
+        ]
+
+    async def _capture_page_view(
+        self,
+        page: Page,
+        screenshot_path: str,
+        mobile: bool,
+        handler: Callable,
+    ):
         if not self.processed_api:
-            await page.route("**/*", self.on_routes(self._path))
+            # Set before awaiting, so concurrent captures register the route once
             self.processed_api = True
+            await page.route("**/*", self.on_routes(self._path))
 
         try:
-            await page.goto(
-                f"https://www.instagram.com/{self.username}",
-                wait_until="networkidle",
-                timeout=10000,
+            await self.load_page(
+                page, f"https://www.instagram.com/{self.username}", self.capture_timeout
             )
         except TimeoutError as e:
             print(e)
@@ -248,6 +289,5 @@ class Instagram(Connector):
         screen, extension = splitext(screenshot_path)
         screenshot_path = screen + ("_mobile" if mobile else "_desktop") + extension
         await page.screenshot(path=screenshot_path, full_page=self.full_page)
-        await page.close()
 
         return [os.path.abspath(screenshot_path)]
@@ -1,11 +1,13 @@
 import os
 import json
-from aiohttp import ClientSession
+from service.http_client import http_client
+from service.executors import write_json
 from .abstract import Connector
 from bs4 import BeautifulSoup
 from logging import getLogger
 from fastapi import WebSocket
 from playwright.async_api import async_playwright, Playwright, Browser, TimeoutError
+from service.browser_pool import BrowserPool
 from service.parsers import extract_usernames
 from service.config import get_config
 
@@ -45,16 +47,14 @@ class Telegram(Connector):
 
     async def get_api_data(self, username: str):
         self.logger.info(f"Getting API data for {username}")
-        async with ClientSession() as session:
-            data = await session.get(f"https://t.me/{username}")
-            responseData = self.parse_data(await data.read())
-        return responseData
+        data = await http_client.read(f"https://t.me/{username}")
+        return self.parse_data(data)
 
     async def process_data(
         self,
         output_path: str,
         store_api_responses: bool = True,
-        browser: Browser = None,
+        pool: BrowserPool = None,
         in_depth: bool = False,
     ):
         self.logger.info(f"Processing data for {self.username}")
@@ -75,8 +75,7 @@ class Telegram(Connector):
                 await self.send_data({"key": "profile_image", "data": image_path})
 
             try:
-                with open(json_path, "w") as f:
-                    json.dump(api_data, f)
+                await write_json(json_path, api_data)
             except Exception as e:
                 self.logger.error(f"Error storing API response: {e}")
 
@@ -99,7 +98,7 @@ class Telegram(Connector):
 
                 captureData[url] = os.path.join(path, f"{username}/capture.png")
 
-        images = await self.capture_page(browser=browser, page_url=captureData)
+        images = await self.capture_page(pool=pool, page_url=captureData)
         await self.send_data({"key": "images", "data": images})
 
         self.logger.info(f"Data processed for {self.username}")
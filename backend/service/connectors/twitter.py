@@ -1,7 +1,7 @@
 import os
 import json, asyncio
-from .abstract import Connector, generator, AsyncNewContext
-from random import choice, randint
+from .abstract import Connector, generator
+from random import randint
 from service.config import (
     TWITTER_ACCOUNTS_PATH,
     TWITTER_USERNAME,
@@ -10,6 +10,7 @@ from service.config import (
 )
 from logging import getLogger
 from service.analysis.llm_spam_detection import analyze_in_bulk, summarise_output
+from service.analysis.url_resolver import expand_tweet_urls
 from playwright.async_api import (
     async_playwright,
     Cookie,
@@ -19,6 +20,10 @@ from playwright.async_api import (
     Browser,
 )
 from fastapi import WebSocket
+from service.browser_pool import BrowserPool
+from service.storage import RecordStore
+from service.executors import run_io, write_json
+from service.credentials import twitter_accounts
 
 
 class Twitter(Connector):
@@ -30,29 +35,11 @@ class Twitter(Connector):
 
         self._client = None
         self._cookies = None
-        self.captured_json = {}
+        self._account = None
         self.result_path = None
-        self.tweets_path = None
-
-    def get_cookies(self):
-        if self._cookies:
-            return self._cookies
-
-        if os.listdir(TWITTER_ACCOUNTS_PATH):
-            cookiePath = os.path.join(
-                TWITTER_ACCOUNTS_PATH, choice(os.listdir(TWITTER_ACCOUNTS_PATH))
-            )
-            with open(cookiePath, "r") as f:
-                cookies = json.load(f)
-            if isinstance(cookies, dict) and cookies.get("cookies"):
-                cookies = cookies["cookies"]
-
-            if isinstance(cookies, list):
-                cookies = {cookie["name"]: cookie["value"] for cookie in cookies}
-            self._cookies = cookies
-            return cookies
-
-        return None
+        self.followers: RecordStore = None
+        self.following: RecordStore = None
+        self.tweets: RecordStore = None
 
     async def get_client(self):
         from twikit import Client
@@ -60,7 +47,9 @@ class Twitter(Connector):
         if not self._client:
             self._client = Client()
 
-            if not os.listdir(TWITTER_ACCOUNTS_PATH):
+            await twitter_accounts.load()
+            account = twitter_accounts.pick()
+            if account is None:
                 await self._client.login(
                     auth_info_1=TWITTER_USERNAME, password=TWITTER_PASSWORD
                 )
@@ -69,13 +58,13 @@ class Twitter(Connector):
                 )
                 self._client.save_cookies(cookies_path)
 
-                with open(cookie_path, "r") as f:
-                    self._cookies = json.load(f)
+                # Make the new account available to other sessions
+                await twitter_accounts.load(force=True)
+                account = twitter_accounts.accounts.get(f"{self.username}.json")
 
-            else:
-                path = choice(os.listdir(TWITTER_ACCOUNTS_PATH))
-                cookie_path = os.path.join(TWITTER_ACCOUNTS_PATH, path)
-                self._cookies = self.get_cookies()
+            if account:
+                self._account = account.name
+                self._cookies = account.cookies
                 self._client.set_cookies(self._cookies)
 
         return self._client
@@ -97,61 +86,65 @@ class Twitter(Connector):
         except TimeoutError:
             pass
 
-    async def handle_browser_session(self, cookies: dict, path: str, browser: Browser):
-        context = await AsyncNewContext(
-            browser, fingerprint=generator.generate(device=("mobile",))
-        )
-        await context.add_cookies(
-            [
+    async def handle_browser_session(self, cookies: dict, path: str, pool: BrowserPool):
+        async with pool.cache.lease(
+            self.service,
+            "mobile",
+            account=self._account,
+            cookies=[
                 Cookie(name=name, value=value, domain=".x.com", path="/")
                 for name, value in cookies.items()
-            ]
-        )
-        page = await context.new_page()
+            ],
+        ) as context:
+            page = await context.new_page()
+            try:
+                await self._run_browser_session(page, path)
+            finally:
+                await page.close()
+
+    async def _run_browser_session(self, page: Page, path: str):
         await page.route("**/*", self.get_on_route(path))
 
         try:
             await page.goto(
                 f"https://x.com/{self.username}",
-                wait_until="networkidle",
+                wait_until="domcontentloaded",
                 timeout=20000,
             )
         except TimeoutError:
             pass
 
-        while not self.captured_json.get("user_profile"):
-            await page.wait_for_timeout(1000)
+        await self.wait_for_signal("user_profile")
+        await self.wait_for_render(page)
 
         profileImage = os.path.join(path, "profile.png")
         await page.screenshot(path=profileImage, full_page=self.full_page)
         imageOutput = [os.path.abspath(profileImage)]
+        self.process_images(imageOutput)
         await self.send_data({"key": "images", "data": imageOutput})
 
-        while not self.captured_json.get("tweets"):
-            await page.wait_for_timeout(1000)
+        await self.wait_for_signal("tweets")
 #        return await browser.close()
 
-        images = await self.capture_bulk_page(
+        # send each screenshot as soon as it is written
+        async def add_image(image: str):
+            imageOutput.append(image)
+            await self.send_data({"key": "images", "data": imageOutput})
+
+        await self.capture_bulk_page(
             page,
             max_screenshots=10,
             message="Capturing tweets",
             path=os.path.join(path, "tweets"),
+            on_image=add_image,
         )
-        imageOutput.extend(images)
-        await self.send_data({"key": "images", "data": imageOutput})
-
-        imageOutput.extend(await self.capture_followers_page(page, path))
-        await self.send_data({"key": "images", "data": imageOutput})
-
-        imageOutput.extend(await self.capture_following_page(page, path))
-        await self.send_data({"key": "images", "data": imageOutput})
+        await self.capture_followers_page(page, path, on_image=add_image)
+        await self.capture_following_page(page, path, on_image=add_image)
 
         random_wait = randint(1000, 5000)
         # random wait to avoid getting flagged
         await page.wait_for_timeout(random_wait)
 
-        await browser.close()
-
     def get_on_route(self, path: str):
 
         async def on_route(route: Route):
@@ -162,11 +155,15 @@ class Twitter(Connector):
             if "https://x.com/i/api/graphql" not in url:
                 return
 
+            response = await request.response()
+            if response:
+                twitter_accounts.record_response(
+                    self._account, url, response.status, response.headers
+                )
+
             if "Followers" in url:
                 self.logger.info(f"Capturing followers for {self.username}")
-                self.followers_path = os.path.join(path, "followers.json")
                 try:
-                    response = await request.response()
                     jsonData = await response.json()
                     followersMap = {}
                     for user in jsonData["data"]["user"]["result"]["timeline"][
@@ -180,23 +177,15 @@ class Twitter(Connector):
                                     ]["result"]["legacy"]
                                     followersMap[user["screen_name"]] = user
 
-                    if os.path.exists(self.followers_path):
-                        with open(self.followers_path, "r", encoding="utf-8") as f:
-                            existing_data = json.load(f)
-                        followersMap.update(existing_data)
-
-                    with open(self.followers_path, "w", encoding="utf-8") as f:
-                        json.dump(followersMap, f, ensure_ascii=False)
+                    await self.followers.append(followersMap)
                 except Exception as e:
                     self.logger.error(f"Error capturing followers: {e}")
 
-                self.captured_json["followers"] = True
+                self.set_signal("followers")
 
             if "Following" in url:
                 self.logger.info(f"Capturing following for {self.username}")
-                self.following_path = os.path.join(path, "following.json")
                 try:
-                    response = await request.response()
                     jsonData = await response.json()
                     followersMap = {}
                     for user in jsonData["data"]["user"]["result"]["timeline"][
@@ -210,24 +199,16 @@ class Twitter(Connector):
                                     ]["result"]["legacy"]
                                     followersMap[user["screen_name"]] = user
 
-                    if os.path.exists(self.following_path):
-                        with open(self.following_path, "r", encoding="utf-8") as f:
-                            existing_data = json.load(f)
-                        followersMap.update(existing_data)
-
-                    with open(self.following_path, "w", encoding="utf-8") as f:
-                        json.dump(followersMap, f, ensure_ascii=False)
+                    await self.following.append(followersMap)
                 except Exception as e:
                     self.logger.error(f"Error capturing following: {e}")
 
-                self.captured_json["following"] = True
+                self.set_signal("following")
 
             if "UserTweets" in url:
-                self.tweets_path = os.path.join(path, "tweets.json")
                 self.logger.info(f"Capturing tweets for {self.username}")
 
                 try:
-                    response = await request.response()
                     jsonData = await response.json()
                     tweetElements = {}
                     for tweet in jsonData["data"]["user"]["result"]["timeline_v2"][
@@ -241,23 +222,15 @@ class Twitter(Connector):
                                     ]["result"]["legacy"]
                                     tweetElements[tweet["id_str"]] = tweet
 
-                    if os.path.exists(self.tweets_path):
-                        with open(self.tweets_path, "r", encoding="utf-8") as f:
-                            existing_data = json.load(f)
-                        tweetElements.update(existing_data)
-
-                    with open(self.tweets_path, "w", encoding="utf-8") as f:
-                        json.dump(tweetElements, f, ensure_ascii=False)
-
+                    await self.tweets.append(tweetElements)
                 except Exception as e:
                     self.logger.error(f"Error capturing tweets: {e}")
 
-                self.captured_json["tweets"] = True
+                self.set_signal("tweets")
 
             if "UserByScreenName" in url:
                 self.logger.info(f"Fetching {url}")
 
-                response = await request.response()
                 jsonData = await response.json()
                 legacy = jsonData["data"]["user"]["result"]["legacy"]
                 filteredData = {
@@ -274,10 +247,9 @@ class Twitter(Connector):
                 await self.send_data({"key": "api_data", "data": filteredData})
 
                 dataPath = os.path.join(path, "api_data.json")
-                with open(dataPath, "w", encoding="utf-8") as f:
-                    json.dump(jsonData, f, ensure_ascii=False)
+                await write_json(dataPath, jsonData, ensure_ascii=False)
 
-                self.captured_json["user_profile"] = True
+                self.set_signal("user_profile")
 
         return on_route
 
@@ -286,74 +258,90 @@ class Twitter(Connector):
         output_path: str,
         store_api_responses: bool = True,
         in_depth: bool = False,
-        browser: Browser = None,
+        pool: BrowserPool = None,
     ):
         path = os.path.join(output_path, f"{self.service}/{self.username}")
         self.result_path = path
         os.makedirs(path, exist_ok=True)
-        cookies = self.get_cookies()
-        if cookies:
-            await self.handle_browser_session(cookies, path, browser)
-        else:
-            self.logger.info(f"No cookies found for {self.username}")
+        self.followers = RecordStore(os.path.join(path, "records", "followers"))
+        self.following = RecordStore(os.path.join(path, "records", "following"))
+        self.tweets = RecordStore(os.path.join(path, "records", "tweets"))
+        async with twitter_accounts.lease() as account:
+            if account:
+                self._account = account.name
+                await self.handle_browser_session(account.cookies, path, pool)
+            else:
+                self.logger.info(f"No cookies found for {self.username}")
+
+        # Also keep the single-file exports the records replaced
+        for name in ("followers", "following", "tweets"):
+            store: RecordStore = getattr(self, name)
+            if await run_io(len, store):
+                await store.export_json(os.path.join(path, f"{name}.json"))
 
-    async def capture_followers_page(self, page: Page, path: str):
+    async def capture_followers_page(self, page: Page, path: str, on_image=None):
         try:
             await page.goto(
                 f"https://x.com/{self.username}/followers",
-                wait_until="networkidle",
+                wait_until="domcontentloaded",
                 timeout=10000,
             )
         except TimeoutError:
             pass
 
-        while not self.captured_json.get("followers"):
-            await page.wait_for_timeout(1000)
+        # the GraphQL payload arriving is what we are waiting for, not network idle
+        await self.wait_for_signal("followers")
 
         return await self.capture_bulk_page(
             page,
             max_screenshots=10,
             message="Capturing followers",
             path=os.path.join(path, "followers"),
+            on_image=on_image,
         )
 
-    async def capture_following_page(self, page: Page, path: str):
+    async def capture_following_page(self, page: Page, path: str, on_image=None):
         try:
             await page.goto(
                 f"https://x.com/{self.username}/following",
-                wait_until="networkidle",
+                wait_until="domcontentloaded",
                 timeout=10000,
             )
         except TimeoutError:
             pass
 
-        while not self.captured_json.get("following"):
-            await page.wait_for_timeout(1000)
+        # the GraphQL payload arriving is what we are waiting for, not network idle
+        await self.wait_for_signal("following")
 
         return await self.capture_bulk_page(
             page,
             max_screenshots=10,
             message="Capturing following",
             path=os.path.join(path, "following"),
+            on_image=on_image,
         )
 
     async def post_task(self):
-        print(self.tweets_path)
-        if self.tweets_path and os.path.exists(self.tweets_path):
+        if self.tweets and await run_io(len, self.tweets):
 
             self.logger.info(f"Starting Twitter Report for {self.username}")
 
             await self.websocket.send_json(
                 {"type": "global_message", "data": "Starting Twitter Report"}
             )
-            with open(self.tweets_path, "r", encoding="utf-8") as f:
-                tweets = json.load(f)
+            # Reading the records back hits the disk, keep it off the event loop
+            tweets = await run_io(list, self.tweets)
+            tweetstoAnalyze = await expand_tweet_urls(
+                [
+                    {"rest_id": rest_id, "text": tweet["full_text"]}
+                    for rest_id, tweet in tweets
+                ]
+            )
 
-            tweetstoAnalyze = [
-                {"rest_id": d, "text": tweets[d]["full_text"]} for d in tweets
-            ]
+            async def send_report(report):
+                await self.websocket.send_json({"type": "twitter_report", "data": report})
 
-            output = summarise_output(tweetstoAnalyze)
+            output = await summarise_output(tweetstoAnalyze, on_update=send_report)
             await self.websocket.send_json({"type": "twitter_report", "data": output})
 
             await self.websocket.send_json({"type": "global_message", "data": ""})
@@ -0,0 +1,403 @@
+"""
+Pools of social network accounts shared by all sessions.
+
+Cookies of every account in TWITTER_ACCOUNTS_PATH are loaded once. Each
+session leases the least loaded account that is not rate limited, and the
+`x-rate-limit-*` headers of intercepted responses keep track of when an
+exhausted account becomes usable again.
+
+Instagram API sessions are logged in once per process and reused across
+requests, one call at a time per session.
+"""
+
+import asyncio, json, os, re
+from time import monotonic, time
+from logging import getLogger
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from service.executors import run_io, run_network
+from service.config import (
+    TWITTER_ACCOUNTS_PATH,
+    TWITTER_SESSIONS_PER_ACCOUNT,
+    TWITTER_LEASE_TIMEOUT,
+    INSTAGRAM_SESSIONS_PATH,
+    INSTAGRAM_USERNAME,
+    INSTAGRAM_PASSWORD,
+    INSTAGRAM_ACCOUNTS,
+    INSTAGRAM_SESSION_REFRESH,
+)
+
+LOG = getLogger(__name__)
+
+# Operation name of a GraphQL API url, e.g. UserTweets
+GRAPHQL_OPERATION = re.compile(r"/i/api/graphql/[^/]+/(\w+)")
+
+# Used when a 429 response does not say when the limit resets
+DEFAULT_COOLDOWN = 15 * 60
+
+
+def read_cookies(path: str) -> Dict[str, str]:
+    """
+    Cookies of an account file, either a list of cookies, a
+    `{"cookies": [...]}` export or a name to value mapping.
+    """
+    with open(path, "r") as f:
+        cookies = json.load(f)
+    if isinstance(cookies, dict) and cookies.get("cookies"):
+        cookies = cookies["cookies"]
+
+    if isinstance(cookies, list):
+        cookies = {cookie["name"]: cookie["value"] for cookie in cookies}
+    return cookies
+
+
+class Account:
+    def __init__(self, name: str, cookies: Dict[str, str]) -> None:
+        self.name = name
+        self.cookies = cookies
+
+        self.active = 0
+        self.uses = 0
+        # Monotonic time until which the account is rate limited
+        self.limited_until = 0.0
+        # Remaining requests and reset time of each endpoint
+        self.limits: Dict[str, dict] = {}
+
+    def is_limited(self) -> bool:
+        return self.limited_until > monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "uses": self.uses,
+            "limited_for": max(self.limited_until - monotonic(), 0),
+            "limits": self.limits,
+        }
+
+
+class CredentialPool:
+    def __init__(
+        self,
+        path: str = TWITTER_ACCOUNTS_PATH,
+        sessions_per_account: int = TWITTER_SESSIONS_PER_ACCOUNT,
+        lease_timeout: float = TWITTER_LEASE_TIMEOUT,
+    ) -> None:
+        self.path = path
+        self.sessions_per_account = sessions_per_account
+        self.lease_timeout = lease_timeout
+
+        self.accounts: Dict[str, Account] = {}
+        self._loaded = False
+        self._condition: asyncio.Condition = None
+
+        self.waits = 0
+        self.timeouts = 0
+
+    def _read_accounts(self) -> Dict[str, Dict[str, str]]:
+        accounts = {}
+        if not self.path or not os.path.isdir(self.path):
+            return accounts
+        for name in sorted(os.listdir(self.path)):
+            try:
+                accounts[name] = read_cookies(os.path.join(self.path, name))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                LOG.error(f"Failed to load cookies of {name}: {e}")
+        return accounts
+
+    async def load(self, force: bool = False):
+        """
+        Load the cookies of all accounts, keeping the usage of known ones.
+        """
+        if self._loaded and not force:
+            return
+        self._loaded = True
+        for name, cookies in (await run_io(self._read_accounts)).items():
+            if name in self.accounts:
+                self.accounts[name].cookies = cookies
+            else:
+                self.accounts[name] = Account(name, cookies)
+        LOG.info(f"Loaded {len(self.accounts)} Twitter accounts")
+
+    def _available(self) -> List[Account]:
+        return [
+            account
+            for account in self.accounts.values()
+            if not account.is_limited() and account.active < self.sessions_per_account
+        ]
+
+    def pick(self) -> Optional[Account]:
+        """
+        The least loaded account that is not rate limited, without leasing it.
+        """
+        available = self._available()
+        if not available:
+            return None
+        return min(available, key=lambda account: (account.active, account.uses))
+
+    def _next_wait(self) -> float:
+        limited = [a.limited_until for a in self.accounts.values() if a.is_limited()]
+        # Otherwise all accounts are busy, and a release will notify
+        return max(min(limited) - monotonic(), 0.1) if limited else self.lease_timeout
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Lease an account for a session, waiting up to `lease_timeout` seconds
+        for one to become available. Yields None if there are no accounts,
+        or none became available in time.
+        """
+        await self.load()
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        account = None
+        deadline = monotonic() + self.lease_timeout
+        async with self._condition:
+            while self.accounts:
+                account = self.pick()
+                if account:
+                    break
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    LOG.warning("No Twitter account available, all are busy or rate limited")
+                    break
+                self.waits += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait(), min(self._next_wait(), remaining)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            if account:
+                account.active += 1
+                account.uses += 1
+
+        try:
+            yield account
+        finally:
+            if account:
+                async with self._condition:
+                    account.active -= 1
+                    self._condition.notify_all()
+
+    def record_response(self, name: str, url: str, status: int, headers) -> None:
+        """
+        Track the rate limit of the endpoint of `url` for the account.
+        """
+        account = self.accounts.get(name)
+        if account is None:
+            return
+
+        match = GRAPHQL_OPERATION.search(url)
+        endpoint = match.group(1) if match else url.split("?")[0]
+        remaining = headers.get("x-rate-limit-remaining")
+        reset = headers.get("x-rate-limit-reset")
+
+        if remaining is not None and reset is not None:
+            try:
+                remaining, reset = int(remaining), float(reset)
+            except ValueError:
+                return
+            account.limits[endpoint] = {"remaining": remaining, "reset": reset}
+            if remaining > 0 and status != 429:
+                return
+            # The reset time is a unix timestamp
+            until = monotonic() + max(reset - time(), 0)
+        elif status == 429:
+            until = monotonic() + DEFAULT_COOLDOWN
+        else:
+            return
+
+        if until > account.limited_until:
+            account.limited_until = until
+            LOG.warning(
+                f"Twitter account {name} rate limited on {endpoint}"
+                f" for {until - monotonic():.0f}s"
+            )
+
+    def stats(self) -> dict:
+        return {
+            "accounts": {name: a.stats() for name, a in self.accounts.items()},
+            "available": len(self._available()),
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+        }
+
+
+twitter_accounts = CredentialPool()
+
+
+def instagram_credentials() -> List[Tuple[str, str]]:
+    credentials = [
+        tuple(account.split(":", 1)) for account in INSTAGRAM_ACCOUNTS if ":" in account
+    ]
+    if INSTAGRAM_USERNAME and INSTAGRAM_USERNAME not in dict(credentials):
+        credentials.insert(0, (INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD))
+    return credentials
+
+
+class InstagramSession:
+    def __init__(self, username: str, password: str) -> None:
+        self.username = username
+        self.password = password
+        self.client = None
+        self._lock: asyncio.Lock = None
+
+        self.uses = 0
+        self.waiting = 0
+        self.logins = 0
+        self.expired = False
+        self.checked_at = monotonic()
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created on first use, so it binds to the running loop and not the
+        # one current when the module-level pool is imported
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def stats(self) -> dict:
+        return {
+            "busy": self.lock.locked(),
+            "waiting": self.waiting,
+            "uses": self.uses,
+            "logins": self.logins,
+            "expired": self.expired,
+        }
+
+
+class InstagramSessionPool:
+    """
+    Logged in instagrapi clients, one per account. Calls are spread across
+    sessions, each session serving a single call at a time since instagrapi
+    clients are not thread safe. Idle sessions are checked in the background
+    and logged in again once expired.
+    """
+
+    def __init__(
+        self,
+        credentials: List[Tuple[str, str]] = None,
+        sessions_path: str = INSTAGRAM_SESSIONS_PATH,
+        refresh_interval: float = INSTAGRAM_SESSION_REFRESH,
+    ) -> None:
+        self.sessions = [
+            InstagramSession(username, password)
+            for username, password in (credentials or instagram_credentials())
+        ]
+        self.sessions_path = sessions_path
+        self.refresh_interval = refresh_interval
+
+        self._refresher: asyncio.Task = None
+
+    def _settings_path(self, session: InstagramSession) -> str:
+        return os.path.join(self.sessions_path, f"{session.username}.json")
+
+    def _login(self, session: InstagramSession, relogin: bool = False):
+        from instagrapi import Client
+
+        path = self._settings_path(session)
+        if session.client is None:
+            session.client = Client()
+            if os.path.exists(path):
+                session.client.load_settings(path)
+
+        if relogin or not os.path.exists(path):
+            if relogin:
+                session.client.relogin()
+            else:
+                session.client.login(session.username, session.password)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            session.client.dump_settings(path)
+            session.logins += 1
+
+        session.expired = False
+        session.checked_at = monotonic()
+
+    def _check(self, session: InstagramSession):
+        from instagrapi.exceptions import LoginRequired
+
+        try:
+            session.client.account_info()
+            session.checked_at = monotonic()
+        except LoginRequired:
+            LOG.info(f"Instagram session of {session.username} expired, logging in again")
+            self._login(session, relogin=True)
+
+    def _pick(self) -> InstagramSession:
+        return min(
+            self.sessions,
+            key=lambda s: (s.lock.locked() + s.waiting, s.expired, s.uses),
+        )
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Lease the least busy session, logging it in first if needed.
+        """
+        if not self.sessions:
+            raise RuntimeError("No Instagram account configured")
+        self.start()
+
+        session = self._pick()
+        session.waiting += 1
+        try:
+            await session.lock.acquire()
+        finally:
+            session.waiting -= 1
+        try:
+            if session.client is None or session.expired:
+                await run_network(self._login, session, session.client is not None)
+            session.uses += 1
+            yield session
+        finally:
+            session.lock.release()
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run `fn(client, *args, **kwargs)` on a leased session, off the event
+        loop. A call failing for an expired session is retried once after
+        logging in again.
+        """
+        from instagrapi.exceptions import LoginRequired
+
+        for attempt in range(2):
+            async with self.lease() as session:
+                try:
+                    return await run_network(fn, session.client, *args, **kwargs)
+                except LoginRequired:
+                    session.expired = True
+                    if attempt:
+                        raise
+
+    def start(self):
+        if self._refresher is None and self.refresh_interval:
+            self._refresher = asyncio.ensure_future(self._refresh())
+
+    async def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for session in self.sessions:
+                # Sessions in use prove themselves, and are retried on failure
+                if session.client is None or session.lock.locked():
+                    continue
+                if monotonic() - session.checked_at < self.refresh_interval:
+                    continue
+                async with session.lock:
+                    try:
+                        await run_network(self._check, session)
+                    except Exception as e:
+                        session.expired = True
+                        LOG.error(f"Failed to refresh Instagram session of {session.username}: {e}")
+
+    def stats(self) -> dict:
+        return {session.username: session.stats() for session in self.sessions}
+
+
+instagram_sessions = InstagramSessionPool()
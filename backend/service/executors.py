@@ -0,0 +1,204 @@
+"""
+Bounded thread pools for blocking calls, and a monitor of event loop lag.
+
+Synchronous SDK calls (instagrapi, ...) run on the `network` pool and disk
+I/O on the `io` pool, so that neither blocks the event loop nor starves the
+other.
+"""
+
+import asyncio, json, sys, threading, traceback
+from time import monotonic
+from functools import partial
+from logging import getLogger
+from concurrent.futures import Future, ThreadPoolExecutor
+from service.config import (
+    NETWORK_EXECUTOR_WORKERS,
+    IO_EXECUTOR_WORKERS,
+    LOOP_LAG_THRESHOLD,
+    LOOP_LAG_INTERVAL,
+)
+
+LOG = getLogger(__name__)
+
+
+class Executors:
+    def __init__(
+        self,
+        network_workers: int = NETWORK_EXECUTOR_WORKERS,
+        io_workers: int = IO_EXECUTOR_WORKERS,
+    ) -> None:
+        self.network_workers = network_workers
+        self.io_workers = io_workers
+        self._network: ThreadPoolExecutor = None
+        self._io: ThreadPoolExecutor = None
+        # Calls submitted to each pool that have not started yet
+        self._queued = {"network": 0, "io": 0}
+        self._queued_lock = threading.Lock()
+
+    @property
+    def network(self) -> ThreadPoolExecutor:
+        if self._network is None:
+            self._network = ThreadPoolExecutor(
+                self.network_workers, thread_name_prefix="network"
+            )
+        return self._network
+
+    @property
+    def io(self) -> ThreadPoolExecutor:
+        if self._io is None:
+            self._io = ThreadPoolExecutor(self.io_workers, thread_name_prefix="io")
+        return self._io
+
+    def shutdown(self):
+        for pool in (self._network, self._io):
+            if pool:
+                pool.shutdown(wait=False)
+        self._network = self._io = None
+
+    def _dequeue(self, name: str):
+        with self._queued_lock:
+            self._queued[name] -= 1
+
+    def submit(self, name: str, fn) -> Future:
+        """
+        Run `fn` on the `name` pool, counting it as queued until it starts.
+        """
+        with self._queued_lock:
+            self._queued[name] += 1
+
+        def run():
+            self._dequeue(name)
+            return fn()
+
+        future = getattr(self, name).submit(run)
+        # Cancelled calls never start
+        future.add_done_callback(lambda f: f.cancelled() and self._dequeue(name))
+        return future
+
+    def stats(self) -> dict:
+        return {
+            name: {"workers": workers, "queued": self._queued[name]}
+            for name, workers in (
+                ("network", self.network_workers),
+                ("io", self.io_workers),
+            )
+        }
+
+
+executors = Executors()
+
+
+async def run_network(fn, *args, **kwargs):
+    """
+    Run a blocking network call, such as a synchronous SDK method.
+    """
+    return await asyncio.wrap_future(
+        executors.submit("network", partial(fn, *args, **kwargs))
+    )
+
+
+async def run_io(fn, *args, **kwargs):
+    """
+    Run a blocking disk operation.
+    """
+    return await asyncio.wrap_future(executors.submit("io", partial(fn, *args, **kwargs)))
+
+
+def _write_json(path: str, data, **kwargs):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+
+
+async def write_json(path: str, data, **kwargs):
+    await run_io(_write_json, path, data, **kwargs)
+
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def write_bytes(path: str, data: bytes):
+    await run_io(_write_bytes, path, data)
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def read_json(path: str):
+    return await run_io(_read_json, path)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a periodic heartbeat. A watchdog
+    thread logs the stack of the loop thread whenever the loop stays blocked
+    longer than `threshold` seconds, pointing at the blocking call.
+    """
+
+    def __init__(
+        self, threshold: float = LOOP_LAG_THRESHOLD, interval: float = LOOP_LAG_INTERVAL
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+
+        self._task: asyncio.Task = None
+        self._watchdog: threading.Thread = None
+        self._stopped = threading.Event()
+        self._loop_thread: int = None
+        self._last_beat = monotonic()
+
+        self.max_lag = 0.0
+        self.blocked = 0
+
+    async def start(self):
+        if self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = monotonic()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = monotonic() - expected
+            self.max_lag = max(self.max_lag, lag)
+            self._last_beat = monotonic()
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            blocked_for = monotonic() - beat
+            if blocked_for < self.threshold + self.interval or reported == beat:
+                continue
+            # Report each blocking call once
+            reported = beat
+            self.blocked += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            LOG.warning(f"Event loop blocked for over {blocked_for:.2f}s in:\n{stack}")
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "max_lag": self.max_lag,
+            "blocked": self.blocked,
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,113 @@
+from logging import getLogger
+from contextlib import asynccontextmanager
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from service.executors import run_io
+from service.config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_TIMEOUT,
+)
+
+LOG = getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HttpClient:
+    """
+    Connection-pooled aiohttp session shared by all connectors.
+
+    Connections are kept alive and DNS lookups cached, with a global and a
+    per-host limit on open connections.
+    """
+
+    def __init__(
+        self,
+        limit: int = HTTP_MAX_CONNECTIONS,
+        limit_per_host: int = HTTP_MAX_PER_HOST,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+        timeout: float = HTTP_TIMEOUT,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+
+        self._session: ClientSession = None
+
+        self.requests = 0
+        self.failed_requests = 0
+        self.bytes_received = 0
+
+    async def start(self):
+        if self._session and not self._session.closed:
+            return
+        self._session = ClientSession(
+            connector=TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            ),
+            timeout=ClientTimeout(total=self.timeout),
+        )
+
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def get_session(self) -> ClientSession:
+        if not self._session or self._session.closed:
+            await self.start()
+        return self._session
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        session = await self.get_session()
+        self.requests += 1
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                yield response
+        except Exception:
+            self.failed_requests += 1
+            raise
+
+    async def read(self, url: str, **kwargs) -> bytes:
+        """
+        GET the url and return the response body.
+        """
+        async with self.request("GET", url, **kwargs) as response:
+            body = await response.read()
+            self.bytes_received += len(body)
+            return body
+
+    async def download(self, url: str, output_path: str, **kwargs) -> str:
+        """
+        Stream the url to `output_path` in chunks, writing from a worker thread.
+        """
+        async with self.request("GET", url, **kwargs) as response:
+            f = await run_io(open, output_path, "wb")
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    self.bytes_received += len(chunk)
+                    await run_io(f.write, chunk)
+            finally:
+                await run_io(f.close)
+        return output_path
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "bytes_received": self.bytes_received,
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+        }
+
+
+http_client = HttpClient()
@@ -0,0 +1,179 @@
+import asyncio, json, os
+from logging import getLogger
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from service.executors import run_io
+from service.images import has_pillow, make_variants, resolve_format, stitch_frames
+from service.config import (
+    IMAGE_PIPELINE_WORKERS,
+    IMAGE_THUMBNAIL_WIDTH,
+    IMAGE_DISPLAY_WIDTH,
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+)
+
+LOG = getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+def update_manifest(directory: str, images: Dict[str, dict], stitched: Dict[str, str]):
+    """
+    Merge entries into the manifest of a directory, with paths relative to it.
+    """
+    path = os.path.join(directory, MANIFEST)
+    manifest = {"images": {}, "stitched": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest.update(json.load(f))
+
+    def relative(entry: dict) -> dict:
+        return {
+            key: os.path.basename(value) if key in ("display", "thumbnail") else value
+            for key, value in entry.items()
+        }
+
+    manifest["images"].update(
+        {os.path.basename(original): relative(entry) for original, entry in images.items()}
+    )
+    manifest["stitched"].update(
+        {name: os.path.basename(output) for name, output in stitched.items()}
+    )
+
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+class ImagePipeline:
+    """
+    Makes thumbnails, display versions and stitched captures of screenshots
+    in a process pool, off the event loop. Outputs are written next to the
+    originals under content-hashed names, and listed in a `manifest.json`
+    of their directory.
+    """
+
+    def __init__(
+        self,
+        workers: int = IMAGE_PIPELINE_WORKERS,
+        thumbnail_width: int = IMAGE_THUMBNAIL_WIDTH,
+        display_width: int = IMAGE_DISPLAY_WIDTH,
+        fmt: str = IMAGE_FORMAT,
+        quality: int = IMAGE_QUALITY,
+    ) -> None:
+        self.workers = workers
+        self.thumbnail_width = thumbnail_width
+        self.display_width = display_width
+        self.fmt = fmt
+        self.quality = quality
+
+        self._pool: ProcessPoolExecutor = None
+        self._enabled: bool = None
+        self._manifest_locks: Dict[str, asyncio.Lock] = {}
+
+        self.processed = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = self.workers > 0 and has_pillow()
+            if not self._enabled:
+                LOG.info("Image pipeline disabled, Pillow is not installed")
+            else:
+                self.fmt = resolve_format(self.fmt)
+        return self._enabled
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool:
+            try:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            except TypeError:
+                # cancel_futures needs Python 3.9
+                self._pool.shutdown(wait=False)
+            self._pool = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.get_pool(), fn, *args)
+
+    async def _update_manifest(
+        self, directory: str, images: Dict[str, dict], stitched: Dict[str, str] = None
+    ):
+        lock = self._manifest_locks.setdefault(directory, asyncio.Lock())
+        async with lock:
+            await run_io(update_manifest, directory, images, stitched or {})
+
+    async def process(self, paths: List[str]) -> Dict[str, dict]:
+        """
+        Make the variants of the images, returning them by original path.
+        Images that fail to process are left out.
+        """
+        if not paths or not self.enabled:
+            return {}
+
+        results = await asyncio.gather(
+            *(
+                self._run(
+                    make_variants,
+                    path,
+                    self.thumbnail_width,
+                    self.display_width,
+                    self.fmt,
+                    self.quality,
+                )
+                for path in paths
+            ),
+            return_exceptions=True,
+        )
+
+        variants = {}
+        for path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                LOG.error(f"Failed to process {path}: {result}")
+                continue
+            self.processed += 1
+            self.bytes_in += result["bytes"]
+            self.bytes_out += result["display_bytes"] + result["thumbnail_bytes"]
+            variants[path] = result
+
+        by_directory: Dict[str, Dict[str, dict]] = {}
+        for path, result in variants.items():
+            by_directory.setdefault(os.path.dirname(path), {})[path] = result
+        for directory, images in by_directory.items():
+            await self._update_manifest(directory, images)
+        return variants
+
+    async def stitch(self, paths: List[str], name: str) -> Optional[str]:
+        """
+        Stitch the frames of a scroll capture into one image called `name`.
+        """
+        if len(paths) < 2 or not self.enabled:
+            return None
+        try:
+            output = await self._run(stitch_frames, paths, name, self.fmt, self.quality)
+        except Exception as e:
+            self.failed += 1
+            LOG.error(f"Failed to stitch {len(paths)} frames: {e}")
+            return None
+        await self._update_manifest(os.path.dirname(paths[0]), {}, {name: output})
+        return output
+
+    def stats(self) -> dict:
+        return {
+            "enabled": bool(self._enabled),
+            "processed": self.processed,
+            "failed": self.failed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,205 @@
+"""
+Screenshot encoding, duplicate detection and post-processing.
+
+Pillow is optional: without it, WebP falls back to JPEG, frames are
+compared by their bytes instead of perceptually and no thumbnails or
+display versions are made.
+"""
+
+import os
+from hashlib import sha1, sha256
+from logging import getLogger
+from typing import Dict, List, Optional, Union
+
+LOG = getLogger(__name__)
+
+# Formats playwright can encode screenshots to by itself
+NATIVE_FORMATS = ("png", "jpeg")
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+# Largest dimension each format can encode
+MAX_DIMENSIONS = {"png": 2**31 - 1, "jpeg": 65535, "webp": 16383}
+
+
+def has_pillow() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(fmt: str) -> str:
+    """
+    The format to encode to, falling back to JPEG for WebP without Pillow.
+    """
+    fmt = (fmt or "png").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in EXTENSIONS:
+        LOG.warning(f"Unknown screenshot format {fmt}, using png")
+        return "png"
+    if fmt == "webp" and not has_pillow():
+        LOG.warning("Pillow is not installed, using jpeg instead of webp")
+        return "jpeg"
+    return fmt
+
+
+def encode(data: bytes, fmt: str, quality: int) -> bytes:
+    """
+    Re-encode a PNG screenshot to a format playwright does not support.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    output = BytesIO()
+    with Image.open(BytesIO(data)) as image:
+        image.save(output, format=fmt.upper(), quality=quality)
+    return output.getvalue()
+
+
+def dhash(data: bytes, size: int = 8) -> int:
+    """
+    Difference hash of an image: one bit per pair of horizontally adjacent
+    pixels of a (size + 1) x size grayscale thumbnail.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        pixels = list(image.convert("L").resize((size + 1, size)).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+class FrameDeduplicator:
+    """
+    Remembers the frames of a capture sequence and tells whether a new frame
+    repeats one of them. `mode` is "bytes", "perceptual" or None to keep
+    every frame. Perceptual frames are duplicates when their hashes differ
+    by at most `distance` bits.
+    """
+
+    def __init__(self, mode: Optional[str] = "bytes", distance: int = 4) -> None:
+        if mode == "perceptual" and not has_pillow():
+            LOG.warning("Pillow is not installed, comparing frames by bytes")
+            mode = "bytes"
+        self.mode = mode
+        self.distance = distance
+        self.hashes: List[Union[int, str]] = []
+        self.dropped = 0
+
+    def is_duplicate(self, data: bytes) -> bool:
+        """
+        Whether `data` repeats a previous frame, remembering it if not.
+        """
+        if not self.mode:
+            return False
+        if self.mode == "perceptual":
+            digest = dhash(data)
+            duplicate = any(
+                bin(digest ^ seen).count("1") <= self.distance for seen in self.hashes
+            )
+        else:
+            digest = sha1(data).hexdigest()
+            duplicate = digest in self.hashes
+
+        if duplicate:
+            self.dropped += 1
+        else:
+            self.hashes.append(digest)
+        return duplicate
+
+
+# The functions below run in the worker processes of the image pipeline.
+
+
+def content_hashed_name(stem: str, data: bytes, suffix: str, fmt: str) -> str:
+    """
+    File name embedding a hash of the content, so it never changes meaning.
+    """
+    return f"{stem}.{sha256(data).hexdigest()[:16]}.{suffix}{EXTENSIONS[fmt]}"
+
+
+def save_variant(
+    image, directory: str, stem: str, suffix: str, fmt: str, quality: int
+) -> str:
+    from io import BytesIO
+
+    if fmt != "png" and max(image.size) > MAX_DIMENSIONS[fmt]:
+        fmt = "jpeg" if max(image.size) <= MAX_DIMENSIONS["jpeg"] else "png"
+
+    output = BytesIO()
+    image.save(output, format=fmt.upper(), quality=quality)
+    data = output.getvalue()
+
+    path = os.path.join(directory, content_hashed_name(stem, data, suffix, fmt))
+    if not os.path.exists(path):
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+def make_variants(
+    path: str, thumbnail_width: int, display_width: int, fmt: str, quality: int
+) -> Dict[str, object]:
+    """
+    Write a thumbnail and a display version of the image next to it.
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+    width, height = image.size
+    directory = os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+
+    display = image
+    if width > display_width:
+        display = image.resize(
+            (display_width, max(round(height * display_width / width), 1)), Image.LANCZOS
+        )
+    thumbnail = image.copy()
+    # Screenshots are tall, limit the width and let the height follow
+    thumbnail.thumbnail((thumbnail_width, thumbnail_width * 4), Image.LANCZOS)
+
+    display_path = save_variant(display, directory, stem, "display", fmt, quality)
+    thumbnail_path = save_variant(thumbnail, directory, stem, "thumb", fmt, quality)
+    return {
+        "width": width,
+        "height": height,
+        "bytes": os.path.getsize(path),
+        "display": display_path,
+        "display_bytes": os.path.getsize(display_path),
+        "thumbnail": thumbnail_path,
+        "thumbnail_bytes": os.path.getsize(thumbnail_path),
+    }
+
+
+def stitch_frames(paths: List[str], stem: str, fmt: str, quality: int) -> str:
+    """
+    Stack the frames of a scroll capture into a single tall image, written
+    in the directory of the first frame.
+    """
+    from PIL import Image
+
+    frames = []
+    for path in paths:
+        with Image.open(path) as frame:
+            frames.append(frame.convert("RGB"))
+
+    stitched = Image.new(
+        "RGB", (max(f.width for f in frames), sum(f.height for f in frames)), "white"
+    )
+    y = 0
+    for frame in frames:
+        stitched.paste(frame, (0, y))
+        y += frame.height
+    return save_variant(
+        stitched, os.path.dirname(paths[0]), stem, "stitched", fmt, quality
+    )
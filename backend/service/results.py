@@ -0,0 +1,271 @@
+"""
+Serving of result files: conditional requests, byte ranges, compression,
+caching headers and streamed tar archives of whole results.
+"""
+
+import os, re, tarfile, zlib
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from logging import getLogger
+from typing import AsyncIterator, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from service.executors import run_io
+from service.config import RESULT_DATA_DIR
+
+LOG = getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TASK_ID = re.compile(r"^[0-9a-f]{32}$")
+# Names written by the image pipeline embed a hash of their content
+CONTENT_HASHED = re.compile(r"\.[0-9a-f]{16}\.[a-z]+\.[a-z]+$")
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+MIN_COMPRESS_SIZE = 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def results_root() -> str:
+    return os.path.realpath(RESULT_DATA_DIR)
+
+
+def resolve_inside(root: str, path: str) -> str:
+    """
+    Real path of `path`, relative to `root`, if it lies inside `root`, 404
+    otherwise.
+    """
+    return check_inside(root, os.path.realpath(os.path.join(root, path)))
+
+
+def check_inside(root: str, resolved: str) -> str:
+    try:
+        inside = os.path.commonpath([root, resolved]) == root
+    except ValueError:
+        # Paths on different drives
+        inside = False
+    if not inside:
+        raise HTTPException(status_code=404, detail="Not found")
+    return resolved
+
+
+def local_result(path: str) -> str:
+    """
+    Real path of a result file given as sent to clients, relative to the
+    working directory (e.g. `results/<task>/a.png`), 404 outside the results.
+    """
+    resolved = check_inside(results_root(), os.path.realpath(path))
+    if not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail="Not found")
+    return resolved
+
+
+def task_dir(task_id: str) -> str:
+    if not TASK_ID.match(task_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(results_root(), task_id)
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return path
+
+
+def result_file(task_id: str, path: str) -> str:
+    resolved = resolve_inside(task_dir(task_id), path)
+    if not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail="Not found")
+    return resolved
+
+
+def make_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+    Weak comparison of `etag` against an If-None-Match header.
+    """
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    # Tags of the gzip encoded representation validate the file too
+    return any(tag.replace('-gz"', '"') == etag for tag in tags)
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) of a single `bytes=` range. Returns None when the
+    header should be ignored, and raises 416 when it cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multiple ranges are answered with the whole file
+        return None
+
+    start, _, end = spec.strip().partition("-")
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416, headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+async def read_file(
+    path: str, start: int = 0, length: int = None
+) -> AsyncIterator[bytes]:
+    f = await run_io(open, path, "rb")
+    try:
+        await run_io(f.seek, start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = await run_io(f.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_io(f.close)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def serve_file(request: Request, path: str) -> Response:
+    """
+    Respond with the file at `path`, honouring conditional and range requests.
+    """
+    stat = await run_io(os.stat, path)
+    etag = make_etag(stat)
+    media_type = guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": (
+            IMMUTABLE if CONTENT_HASHED.search(os.path.basename(path)) else REVALIDATE
+        ),
+        "Accept-Ranges": "bytes",
+    }
+
+    if not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, size)
+
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        body = read_file(path, start, end - start + 1)
+        status_code = 206
+    elif (
+        media_type.startswith(COMPRESSIBLE_TYPES)
+        and size >= MIN_COMPRESS_SIZE
+        and "gzip" in request.headers.get("accept-encoding", "")
+    ):
+        # The compressed representation is a different entity
+        headers["ETag"] = etag[:-1] + '-gz"'
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        body = gzip_chunks(read_file(path))
+        status_code = 200
+    else:
+        headers["Content-Length"] = str(size)
+        body = read_file(path)
+        status_code = 200
+
+    if request.method == "HEAD":
+        await body.aclose()
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        body, status_code=status_code, headers=headers, media_type=media_type
+    )
+
+
+def _walk(root: str):
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            # Skip partially written files
+            if not name.endswith(".tmp") and os.path.isfile(path):
+                yield path, os.path.relpath(path, os.path.dirname(root))
+
+
+async def stream_tar(root: str) -> AsyncIterator[bytes]:
+    """
+    Tar archive of a directory, generated as it is sent: each file is a
+    header followed by its content padded to whole blocks.
+    """
+    files = await run_io(lambda: list(_walk(root)))
+    for path, name in files:
+        try:
+            stat = await run_io(os.stat, path)
+        except FileNotFoundError:
+            continue
+        info = tarfile.TarInfo(name.replace(os.sep, "/"))
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+        written = 0
+        async for chunk in read_file(path, 0, info.size):
+            written += len(chunk)
+            yield chunk
+        if written < info.size:
+            # The file shrank since it was listed, keep the archive consistent
+            yield b"\0" * (info.size - written)
+        if info.size % tarfile.BLOCKSIZE:
+            yield b"\0" * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+    yield b"\0" * (2 * tarfile.BLOCKSIZE)
+
+
+def tar_response(task_id: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_tar(task_dir(task_id)),
+        media_type="application/x-tar",
+        headers={
+            "Content-Disposition": f'attachment; filename="{task_id}.tar"',
+            "Cache-Control": REVALIDATE,
+        },
+    )
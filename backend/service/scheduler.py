@@ -0,0 +1,78 @@
+import asyncio
+from time import perf_counter
+from logging import getLogger
+from typing import Awaitable, Callable, Dict
+from service.config import (
+    MAX_CONCURRENT_CONNECTORS,
+    MAX_CONNECTORS_PER_REQUEST,
+    CONNECTOR_TIMEOUT,
+)
+
+LOG = getLogger(__name__)
+
+# Shared by every request handled by this process, created lazily so it binds
+# to the running event loop.
+_global_slots: asyncio.Semaphore = None
+
+
+def get_global_slots() -> asyncio.Semaphore:
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(MAX_CONCURRENT_CONNECTORS)
+    return _global_slots
+
+
+class ConnectorScheduler:
+    """
+    Run the connectors of a single request concurrently.
+
+    Jobs are bounded both per request and across the process. A job that fails
+    or times out is logged and recorded, the remaining jobs keep running. A
+    `timeout` of 0 lets jobs run for as long as they need.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONNECTORS_PER_REQUEST,
+        timeout: float = CONNECTOR_TIMEOUT,
+    ) -> None:
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.timeout = timeout
+        self.timings: Dict[str, dict] = {}
+
+    async def _run_job(self, name: str, job: Callable[[], Awaitable]):
+        queued_at = perf_counter()
+        # Hold a global slot only once this request may run the job
+        async with self._slots, get_global_slots():
+            started_at = perf_counter()
+            status = "ok"
+            try:
+                await asyncio.wait_for(job(), timeout=self.timeout or None)
+            except asyncio.TimeoutError:
+                status = "timeout"
+                LOG.warning(f"{name} timed out after {self.timeout}s")
+            except Exception as e:
+                status = "error"
+                LOG.exception(f"{name} failed: {e}")
+            finally:
+                elapsed = perf_counter() - started_at
+                self.timings[name] = {
+                    "status": status,
+                    "queued": round(started_at - queued_at, 3),
+                    "elapsed": round(elapsed, 3),
+                }
+                LOG.info(f"{name} finished with status {status} in {elapsed:.2f}s")
+
+    async def run(self, jobs: Dict[str, Callable[[], Awaitable]]) -> Dict[str, dict]:
+        """
+        Run all jobs and return the timing of each one, keyed by job name.
+        """
+        started_at = perf_counter()
+        await asyncio.gather(*(self._run_job(name, job) for name, job in jobs.items()))
+        wall = perf_counter() - started_at
+
+        total = sum(timing["elapsed"] for timing in self.timings.values())
+        LOG.info(
+            f"Ran {len(jobs)} jobs in {wall:.2f}s wall time ({total:.2f}s combined)"
+        )
+        return {name: self.timings[name] for name in jobs}
@@ -0,0 +1,139 @@
+import asyncio, json, os
+from logging import getLogger
+from typing import Dict, Iterator, Set, Tuple
+from service.executors import run_io
+
+LOG = getLogger(__name__)
+
+# Size after which a new segment file is started, in bytes
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+
+class RecordStore:
+    """
+    Append-only store of JSON records, keyed by id.
+
+    Records are written as NDJSON lines into numbered segment files inside
+    `path`, with the ids kept in an index file so duplicates are skipped
+    without reading the records back. Appending is linear in the size of the
+    new records and happens off the event loop.
+    """
+
+    def __init__(self, path: str, segment_size: int = SEGMENT_SIZE) -> None:
+        self.path = path
+        self.segment_size = segment_size
+
+        self._ids: Set[str] = None
+        self._segment = 0
+        self._lock: asyncio.Lock = None
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, "index")
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:05d}.ndjson")
+
+    def segments(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if name.startswith("segment-") and name.endswith(".ndjson")
+        )
+
+    def _load_index(self):
+        if self._ids is not None:
+            return
+
+        self._ids = set()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._ids.update(line.rstrip("\n") for line in f)
+
+        segments = self.segments()
+        self._segment = len(segments) - 1 if segments else 0
+
+    def _append(self, records: Dict[str, dict]) -> int:
+        self._load_index()
+        os.makedirs(self.path, exist_ok=True)
+
+        lines, ids = [], []
+        for record_id, record in records.items():
+            record_id = str(record_id)
+            if record_id in self._ids:
+                continue
+            self._ids.add(record_id)
+            ids.append(record_id + "\n")
+            lines.append(
+                json.dumps({"id": record_id, "data": record}, ensure_ascii=False)
+                + "\n"
+            )
+
+        if not lines:
+            return 0
+
+        segment_path = self.segment_path(self._segment)
+        if (
+            os.path.exists(segment_path)
+            and os.path.getsize(segment_path) >= self.segment_size
+        ):
+            self._segment += 1
+            segment_path = self.segment_path(self._segment)
+
+        with open(segment_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.writelines(ids)
+        return len(lines)
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def append(self, records: Dict[str, dict]) -> int:
+        """
+        Append the records whose id is not stored yet, returning how many were written.
+        """
+        async with self._get_lock():
+            return await run_io(self._append, records)
+
+    def __iter__(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Lazily iterate over (id, record) pairs in insertion order.
+        """
+        for segment in self.segments():
+            with open(segment, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    yield entry["id"], entry["data"]
+
+    def _export_json(self, path: str):
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write("{")
+            for i, (record_id, record) in enumerate(self):
+                f.write(", " if i else "")
+                f.write(json.dumps(record_id) + ": ")
+                f.write(json.dumps(record, ensure_ascii=False))
+            f.write("}")
+        os.replace(f"{path}.tmp", path)
+
+    async def export_json(self, path: str):
+        """
+        Write all records to `path` as a single `{id: record}` JSON object,
+        streamed from the segments.
+        """
+        async with self._get_lock():
+            await run_io(self._export_json, path)
+
+    def __len__(self) -> int:
+        self._load_index()
+        return len(self._ids)
+
+    def __contains__(self, record_id: str) -> bool:
+        self._load_index()
+        return str(record_id) in self._ids
@@ -0,0 +1,15 @@
+import os, sys
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    """
+    Run each test from its own directory, so results, caches and models
+    written relative to the working directory stay out of the tree.
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
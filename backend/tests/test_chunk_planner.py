@@ -0,0 +1,60 @@
+from service.analysis.llm_spam_detection import (
+    ChunkPlanner,
+    estimate_tokens,
+    encode_tweets,
+    TWEET_OVERHEAD_TOKENS,
+)
+
+
+def tweets(count, text="hello world"):
+    return [{"rest_id": str(i), "text": text} for i in range(count)]
+
+
+def test_planner_limits_tweets_per_chunk():
+    planner = ChunkPlanner(context_tokens=100_000, output_tokens=1000, max_tweets=10)
+    chunks = list(planner.plan(tweets(25)))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+
+
+def test_planner_respects_input_budget():
+    planner = ChunkPlanner(context_tokens=100_000, output_tokens=1000, max_tweets=1000)
+    text = "word " * 20_000
+    cost = estimate_tokens(text) + TWEET_OVERHEAD_TOKENS
+    chunks = list(planner.plan(tweets(10, text)))
+    assert len(chunks) > 1
+    assert sum(len(chunk) for chunk in chunks) == 10
+    for chunk in chunks:
+        assert len(chunk) == 1 or len(chunk) * cost <= planner.input_budget
+
+
+def test_planner_keeps_oversized_tweets_alone():
+    planner = ChunkPlanner(context_tokens=2000, output_tokens=500, max_tweets=10)
+    chunks = list(planner.plan(tweets(2, "word " * 10_000)))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+
+
+def test_planner_shrinks_and_grows_back():
+    planner = ChunkPlanner(context_tokens=100_000, output_tokens=1000, max_tweets=40)
+    planner.shrink(40)
+    assert planner.max_tweets == 20
+    planner.shrink(40)
+    assert planner.max_tweets == 20
+
+    # Smaller chunks do not prove the limit fits
+    planner.grow(5)
+    assert planner.max_tweets == 20
+
+    for _ in range(10):
+        planner.grow(planner.max_tweets)
+    assert planner.max_tweets == 40
+
+
+def test_planner_never_shrinks_below_one():
+    planner = ChunkPlanner(max_tweets=2)
+    planner.shrink(1)
+    assert planner.max_tweets == 1
+
+
+def test_encode_tweets_is_one_compact_line_per_tweet():
+    encoded = encode_tweets([{"rest_id": "1", "text": "héllo"}, {"rest_id": "2", "text": "a b"}])
+    assert encoded == '{"rest_id":"1","text":"héllo"}\n{"rest_id":"2","text":"a b"}'
@@ -0,0 +1,39 @@
+import io
+import pytest
+from service.images import FrameDeduplicator, has_pillow
+
+
+def test_bytes_mode_drops_repeated_frames():
+    frames = FrameDeduplicator("bytes")
+    assert not frames.is_duplicate(b"a")
+    assert not frames.is_duplicate(b"b")
+    assert frames.is_duplicate(b"a")
+    assert frames.dropped == 1
+
+
+def test_disabled_keeps_every_frame():
+    frames = FrameDeduplicator(None)
+    assert not frames.is_duplicate(b"a")
+    assert not frames.is_duplicate(b"a")
+    assert frames.dropped == 0
+
+
+@pytest.mark.skipif(not has_pillow(), reason="Pillow is not installed")
+def test_perceptual_mode_drops_near_duplicates():
+    from PIL import Image
+
+    frames = FrameDeduplicator("perceptual")
+    image = Image.new("RGB", (64, 64), "white")
+    image.paste((0, 0, 0), (0, 0, 32, 64))
+    original = io.BytesIO()
+    image.save(original, format="PNG")
+    # Same picture, different encoding
+    recompressed = io.BytesIO()
+    image.save(recompressed, format="PNG", compress_level=0)
+
+    assert not frames.is_duplicate(original.getvalue())
+    assert frames.is_duplicate(recompressed.getvalue())
+
+    flipped = io.BytesIO()
+    image.transpose(Image.FLIP_LEFT_RIGHT).save(flipped, format="PNG")
+    assert not frames.is_duplicate(flipped.getvalue())
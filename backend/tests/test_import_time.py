@@ -0,0 +1,54 @@
+import json, os, subprocess, sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module level work of the analysis modules themselves, in seconds
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = ["pandas", "sklearn", "imblearn", "nltk", "groq", "joblib", "matplotlib"]
+
+SCRIPT = """
+import json, sys
+import service.analysis
+import service.analysis.tweets
+import service.analysis.llm_spam_detection
+import service.analysis.triage
+print(json.dumps(sorted(m for m in %r if m in sys.modules)))
+""" % HEAVY_MODULES
+
+
+def import_analysis(cwd):
+    path = [BACKEND_DIR] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    self_time = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if fields[-1].strip().startswith("service.analysis"):
+            self_time += int(fields[0])
+    return json.loads(result.stdout.splitlines()[-1]), self_time / 1e6
+
+
+def test_analysis_imports_no_heavy_dependencies(tmp_path):
+    loaded, _ = import_analysis(tmp_path)
+    assert loaded == []
+
+
+def test_import_leaves_working_directory_untouched(tmp_path):
+    import_analysis(tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_analysis_import_time_budget(tmp_path):
+    _, elapsed = import_analysis(tmp_path)
+    assert elapsed < IMPORT_BUDGET, f"analysis modules took {elapsed:.2f}s to import"
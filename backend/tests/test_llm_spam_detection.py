@@ -0,0 +1,122 @@
+import asyncio, json
+from time import monotonic
+from types import SimpleNamespace
+import pytest
+from service.analysis import llm_spam_detection as llm
+from service.analysis.llm_spam_detection import RateLimiter, parse_duration
+from service.analysis.triage import triage
+from service.cache import PersistentCache
+
+
+def test_parse_duration():
+    assert parse_duration("2m59.56s") == 179.56
+    assert parse_duration("7.66s") == 7.66
+    assert parse_duration("120ms") == 0.12
+    assert parse_duration("1h") == 3600
+    assert parse_duration(None) == 0
+
+
+def test_rate_limiter_pauses_on_exhausted_limit():
+    limiter = RateLimiter()
+    limiter.update({"x-ratelimit-remaining-requests": "5"})
+    assert limiter._resume_at <= monotonic()
+
+    limiter.update(
+        {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "30s"}
+    )
+    assert 29 < limiter._resume_at - monotonic() <= 30
+
+
+def test_rate_limiter_backoff_honours_retry_after():
+    limiter = RateLimiter()
+    limiter.backoff({"retry-after": "12"}, attempt=0)
+    assert 11 < limiter._resume_at - monotonic() <= 12
+
+
+def test_rate_limiter_keeps_longest_pause():
+    limiter = RateLimiter()
+    limiter.backoff({"retry-after": "60"}, attempt=0)
+    limiter.backoff({"retry-after": "1"}, attempt=0)
+    assert limiter._resume_at - monotonic() > 59
+
+
+def test_rate_limiter_wait_returns_when_not_limited():
+    asyncio.run(asyncio.wait_for(RateLimiter().wait(), 1))
+
+
+class FakeLLM:
+    """
+    Answers every chunk with one result per tweet, later chunks faster, and
+    records how many requests were in flight at once.
+    """
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+        self.chat = SimpleNamespace(
+            completions=SimpleNamespace(
+                with_raw_response=SimpleNamespace(create=self.create)
+            )
+        )
+
+    async def create(self, messages, **kwargs):
+        tweets = [json.loads(line) for line in messages[1]["content"].splitlines()]
+        self.requests.append(tweets)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.05 / len(self.requests))
+        finally:
+            self.in_flight -= 1
+
+        content = json.dumps(
+            {
+                "results": [
+                    {"tweetId": tweet["rest_id"], "spam_likelihood": 0.5, "reason": tweet["text"]}
+                    for tweet in tweets
+                ]
+            }
+        )
+        message = SimpleNamespace(
+            choices=[
+                SimpleNamespace(finish_reason="stop", message=SimpleNamespace(content=content))
+            ]
+        )
+        return SimpleNamespace(headers={}, parse=lambda: message)
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(llm, "get_llm", lambda: fake)
+    monkeypatch.setattr(llm, "planner", llm.ChunkPlanner(max_tweets=2))
+    monkeypatch.setattr(
+        llm, "classification_cache", PersistentCache(str(tmp_path / "cache.sqlite"))
+    )
+    monkeypatch.setattr(triage, "enabled", False)
+    return fake
+
+
+def test_analyze_in_bulk_orders_dedupes_and_limits_concurrency(fake_llm):
+    tweets = [{"rest_id": str(i), "text": f"tweet {i}"} for i in range(10)]
+    # Same text as tweet 0, only sent once
+    tweets.append({"rest_id": "dup", "text": "tweet 0"})
+
+    results = asyncio.run(llm.analyze_in_bulk(tweets, concurrency=2))
+
+    assert [r["tweetId"] for r in results] == [t["rest_id"] for t in tweets]
+    assert results[-1]["reason"] == "tweet 0"
+    sent = [tweet["rest_id"] for request in fake_llm.requests for tweet in request]
+    assert sorted(sent) == sorted(str(i) for i in range(10))
+    assert fake_llm.max_in_flight == 2
+
+
+def test_analyze_in_bulk_serves_repeats_from_cache(fake_llm):
+    tweets = [{"rest_id": str(i), "text": f"tweet {i}"} for i in range(4)]
+    asyncio.run(llm.analyze_in_bulk(tweets))
+    requests = len(fake_llm.requests)
+
+    results = asyncio.run(llm.analyze_in_bulk(tweets))
+    assert len(fake_llm.requests) == requests
+    assert [r["tweetId"] for r in results] == ["0", "1", "2", "3"]
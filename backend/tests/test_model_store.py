@@ -0,0 +1,96 @@
+import os
+import pytest
+
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from service.analysis.model_store import (
+    ModelRegistry,
+    check_version,
+    current_version,
+    save_artifact,
+)
+
+TEXTS = ["you are great", "have a nice day", "i hate you", "you are awful"] * 5
+LABELS = [0, 0, 1, 1] * 5
+
+
+def train(n_estimators=5):
+    vectorizer = TfidfVectorizer()
+    X = vectorizer.fit_transform(TEXTS)
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=0)
+    return model.fit(X, LABELS), vectorizer
+
+
+def save(model_dir, score, activate=True):
+    model, vectorizer = train()
+    version = save_artifact(model, vectorizer, score, str(model_dir), activate=activate)
+    return version, model, vectorizer
+
+
+def test_forest_arrays_match_forest(tmp_path):
+    version, model, vectorizer = save(tmp_path, 0.9)
+    registry = ModelRegistry(str(tmp_path))
+    assert registry.load()
+
+    forest, loaded_vectorizer, manifest = registry.current
+    assert manifest["version"] == version
+    X = loaded_vectorizer.transform(TEXTS)
+    assert forest.predict_proba(X) == pytest.approx(model.predict_proba(X))
+
+
+def test_reload_switches_version(tmp_path):
+    first, _, _ = save(tmp_path, 0.8)
+    second, _, _ = save(tmp_path, 0.9, activate=False)
+    registry = ModelRegistry(str(tmp_path))
+    registry.load()
+    assert registry.stats()["version"] == first
+
+    registry.reload(second)
+    assert registry.stats()["version"] == second
+    assert current_version(str(tmp_path)) == second
+
+    # Rolling back is reloading the previous version
+    registry.reload(first)
+    assert registry.stats()["version"] == first
+    assert current_version(str(tmp_path)) == first
+
+
+def test_failed_reload_keeps_previous_model(tmp_path):
+    good, _, _ = save(tmp_path, 0.8)
+    broken, _, _ = save(tmp_path, 0.9, activate=False)
+    with open(os.path.join(tmp_path, broken, "threshold.npy"), "ab") as f:
+        f.write(b"corrupt")
+
+    registry = ModelRegistry(str(tmp_path))
+    registry.load()
+    with pytest.raises(Exception):
+        registry.reload(broken)
+
+    assert registry.stats()["version"] == good
+    assert registry.stats()["failed_reloads"] == 1
+    # Other workers are not pointed at the broken version
+    assert current_version(str(tmp_path)) == good
+
+
+def test_refresh_follows_pointer(tmp_path):
+    save(tmp_path, 0.8)
+    registry = ModelRegistry(str(tmp_path))
+    registry.load()
+    assert not registry.refresh()
+
+    latest, _, _ = save(tmp_path, 0.9)
+    # Make sure the pointer mtime changes on coarse filesystems
+    pointer = os.path.join(tmp_path, "CURRENT")
+    stat = os.stat(pointer)
+    os.utime(pointer, (stat.st_atime, stat.st_mtime + 10))
+    assert registry.refresh()
+    assert registry.stats()["version"] == latest
+
+
+@pytest.mark.parametrize("version", ["", "..", "../models", ".hidden", "missing"])
+def test_check_version_rejects_unknown_names(tmp_path, version):
+    save(tmp_path, 0.8)
+    with pytest.raises(FileNotFoundError):
+        check_version(str(tmp_path), version)
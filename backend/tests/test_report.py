@@ -0,0 +1,68 @@
+import asyncio
+from service.analysis.report import MAX_REASON_CHARS, ReasonSummarizer, ReportAggregator
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def summarize_all(reasons, summarize):
+    async def run():
+        summarizer = ReasonSummarizer(summarize, estimate_tokens)
+        summarizer.add(reasons)
+        return await asyncio.wait_for(summarizer.result(), 5), summarizer
+
+    return asyncio.run(run())
+
+
+def test_long_summaries_converge():
+    calls = []
+
+    async def summarize(batch):
+        calls.append(len(batch))
+        return "s" * 3100
+
+    summary, _ = summarize_all([f"r{i} " + "y" * 600 for i in range(200)], summarize)
+    assert len(summary) == MAX_REASON_CHARS
+    assert all(size > 1 for size in calls)
+    assert len(calls) < 40
+
+
+def test_failed_summary_keeps_every_reason():
+    async def summarize(batch):
+        raise RuntimeError("unavailable")
+
+    summary, summarizer = summarize_all(["first reason", "second reason"], summarize)
+    assert "first" in summary and "second" in summary
+    assert summarizer.failed == 1
+
+
+def test_single_reason_is_not_summarized():
+    async def summarize(batch):
+        raise AssertionError("no request expected")
+
+    assert summarize_all(["only"], summarize)[0] == "only"
+    assert summarize_all([], summarize)[0] == ""
+
+
+def test_aggregator_means():
+    report = ReportAggregator(total=2)
+    report.add([{"tweetId": "1", "spam_likelihood": 0.2}, {"tweetId": "2", "spam_likelihood": 0.6}])
+    snapshot = report.snapshot()
+    assert snapshot["spam_likelihood"] == 0.4
+    assert snapshot["max"]["spam_likelihood"] == 0.6
+    assert snapshot["analyzed"] == 2
+
+
+def test_triaged_results_only_count_for_their_category():
+    report = ReportAggregator(total=2)
+    report.add(
+        [
+            {"tweetId": "1", "spam_likelihood": 0.8, "profanity_detection": 0.4},
+            {"tweetId": "2", "profanity_detection": 0.0, "triaged": True},
+        ]
+    )
+    snapshot = report.snapshot()
+    assert snapshot["spam_likelihood"] == 0.8
+    assert snapshot["profanity_detection"] == 0.2
+    assert snapshot["triaged"] == 1
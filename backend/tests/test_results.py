@@ -0,0 +1,87 @@
+import os
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from service import results
+from service.app import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(results, "RESULT_DATA_DIR", "results")
+    task = tmp_path / "results" / ("a" * 32)
+    task.mkdir(parents=True)
+    (task / "a.png").write_bytes(b"image")
+    (tmp_path / "secret.txt").write_text("secret")
+    return TestClient(app)
+
+
+def test_file_serves_paths_relative_to_working_directory(client):
+    response = client.get(f"/file/results/{'a' * 32}/a.png")
+    assert response.status_code == 200
+    assert response.content == b"image"
+    assert response.headers["etag"]
+
+
+def test_file_accepts_quoted_paths(client):
+    response = client.get(f"/file/results%2F{'a' * 32}%2Fa.png")
+    assert response.status_code == 200
+
+
+def test_file_rejects_paths_outside_results(client):
+    assert client.get("/file/secret.txt").status_code == 404
+    assert client.get("/file/results/..%2Fsecret.txt").status_code == 404
+    assert client.get(f"/file/{os.path.abspath('secret.txt')}").status_code == 404
+
+
+def test_file_missing(client):
+    assert client.get(f"/file/results/{'a' * 32}/b.png").status_code == 404
+
+
+def test_parse_range():
+    assert results.parse_range("bytes=0-99", 1000) == (0, 99)
+    assert results.parse_range("bytes=900-", 1000) == (900, 999)
+    assert results.parse_range("bytes=-100", 1000) == (900, 999)
+    assert results.parse_range("bytes=-5000", 1000) == (0, 999)
+    assert results.parse_range("bytes=990-2000", 1000) == (990, 999)
+
+
+def test_parse_range_ignored():
+    assert results.parse_range("items=0-10", 1000) is None
+    assert results.parse_range("bytes=0-10,20-30", 1000) is None
+    assert results.parse_range("bytes=a-b", 1000) is None
+    assert results.parse_range("bytes=-0", 1000) is None
+
+
+def test_parse_range_unsatisfiable():
+    for header in ("bytes=1000-", "bytes=500-400"):
+        with pytest.raises(HTTPException) as error:
+            results.parse_range(header, 1000)
+        assert error.value.status_code == 416
+        assert error.value.headers["Content-Range"] == "bytes */1000"
+
+
+def test_etag_matches():
+    etag = '"10-abc"'
+    assert results.etag_matches('"10-abc"', etag)
+    assert results.etag_matches('W/"10-abc"', etag)
+    assert results.etag_matches('"other", "10-abc"', etag)
+    assert results.etag_matches('"10-abc-gz"', etag)
+    assert results.etag_matches("*", etag)
+    assert not results.etag_matches('"10-abd"', etag)
+
+
+def test_range_request(client):
+    response = client.get(
+        f"/results/{'a' * 32}/a.png", headers={"Range": "bytes=1-3"}
+    )
+    assert response.status_code == 206
+    assert response.content == b"mag"
+    assert response.headers["content-range"] == "bytes 1-3/5"
+
+
+def test_conditional_request(client):
+    url = f"/results/{'a' * 32}/a.png"
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304